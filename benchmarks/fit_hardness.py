@@ -0,0 +1,94 @@
+import json
+import logging
+import time
+from pathlib import Path
+
+import numpy as np
+
+from blokk_solver.blokks import shape_class_representative
+from blokk_solver.combinatorics import BlokkCombinatorics
+from blokk_solver.hardness import HARDNESS_WEIGHTS, sample_features
+from blokk_solver.solver import solve_bitmasks
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+
+def fit_hardness(
+    output="hardness_fit.json",
+    cube_size=3,
+    max_blokk_volume=5,
+    method="occupancy",
+    repeats=3,
+    loglevel="INFO",
+) -> dict:
+    """
+    Fit the HARDNESS_WEIGHTS and HARDNESS_INTERCEPT of blokk_solver.hardness: time
+    solve_bitmasks on every multiset of shapes of the cube, and fit log2 of the
+    seconds to the sample_features by least squares. Writes the weights, the
+    intercept, the Spearman correlation of the fitted scores with the measured
+    times and every measurement to output as JSON.
+
+    The defaults reproduce the fit in blokk_solver.hardness. Refit for a bigger
+    cube with e.g. fit_hardness(cube_size=4), and copy the weights over.
+    """
+    logging.getLogger().setLevel(loglevel)
+    combinatorics = BlokkCombinatorics(
+        max_blokk_volume=max_blokk_volume, cube_size=cube_size
+    )
+    names = list(HARDNESS_WEIGHTS)
+    features, seconds = [], []
+    for _, key in combinatorics.generate_shape_class_samples():
+        blokk_ids = shape_class_representative(key)
+        # the first solve loads the placements, which is not part of the search
+        solve_bitmasks(blokk_ids, cube_size=cube_size, method=method)
+        seconds.append(_best_of(blokk_ids, cube_size, method, repeats))
+        sample = sample_features(blokk_ids, cube_size)
+        features.append([sample[name] for name in names])
+    logger.info(f"Timed {len(seconds)} multisets of shapes")
+
+    x = np.column_stack([np.array(features), np.ones(len(features))])
+    y = np.log2(seconds)
+    coefficients, *_ = np.linalg.lstsq(x, y, rcond=None)
+    spearman = _spearman(x @ coefficients, y)
+    weights = dict(zip(names, coefficients[:-1].round(2).tolist()))
+    intercept = round(float(coefficients[-1]), 1)
+    logger.info(
+        f"HARDNESS_WEIGHTS = {weights}\n"
+        f"HARDNESS_INTERCEPT = {intercept}\n"
+        f"Spearman correlation {spearman:.2f}"
+    )
+
+    results = {
+        "cube_size": cube_size,
+        "max_blokk_volume": max_blokk_volume,
+        "method": method,
+        "weights": weights,
+        "intercept": intercept,
+        "spearman": spearman,
+        "samples": [
+            {**dict(zip(names, f)), "seconds": s} for f, s in zip(features, seconds)
+        ],
+    }
+    Path(output).write_text(json.dumps(results, indent=2))
+    logger.info(f"Wrote the fit to {output}")
+    return results
+
+
+def _best_of(blokk_ids, cube_size, method, repeats) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        solve_bitmasks(blokk_ids, cube_size=cube_size, method=method)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _spearman(a: np.ndarray, b: np.ndarray) -> float:
+    # the correlation of the ranks, without scipy
+    rank_a, rank_b = a.argsort().argsort(), b.argsort().argsort()
+    return float(np.corrcoef(rank_a, rank_b)[0, 1])
+
+
+if __name__ == "__main__":
+    fit_hardness()
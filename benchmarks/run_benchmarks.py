@@ -0,0 +1,259 @@
+import json
+import logging
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+
+from blokk_solver.blokks import BlokkSet, get_blokks, shape_class_representative
+from blokk_solver.combinatorics import BlokkCombinatorics
+from blokk_solver.geometry import generate_all_placements
+from blokk_solver.solver import DEAD_ENDS, solve_bitmasks
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# The engines timed on the solve corpus. "product" and "vectorized" test every build
+# of the cartesian product of placements, which is out of reach for a 3x3x3 subset.
+SOLVE_METHODS = ("occupancy", "occupancy_pruned", "occupancy_memo", "exact_cover")
+
+# The corpus is every CORPUS_STRIDE-th multiset of shapes of the 3x3x3 cube, in the
+# order of BlokkCombinatorics.generate_shape_class_samples, so it is the same on
+# every machine and version and covers solvable and unsolvable subsets of all sizes.
+# A 2x2x2 cube can only hold blokks 1 and 2, which never fill it, so it has no
+# corpus.
+CORPUS_CUBE_SIZE = 3
+CORPUS_STRIDE = 25
+
+
+def run_benchmarks(
+    output="benchmark.json",
+    placement_cube_sizes=(2, 3, 4, 5),
+    sample_cube_size=3,
+    methods=SOLVE_METHODS,
+    repeats=3,
+    loglevel="INFO",
+) -> dict:
+    """
+    Time placement generation, sample generation, streaming samples to DuckDB and
+    solving a fixed corpus of subsets with each of methods, and write the results to
+    output as JSON. Every timing is the best of repeats runs.
+
+    Compare two result files with compare_benchmarks to spot regressions between
+    engines or versions.
+    """
+    logging.getLogger().setLevel(loglevel)
+    results = {
+        "meta": _meta(repeats),
+        "placements": [
+            bench_placements(cube_size, repeats) for cube_size in placement_cube_sizes
+        ],
+        "samples": bench_samples(sample_cube_size, repeats),
+        "duckdb": bench_duckdb(sample_cube_size, repeats),
+        "solve": [bench_solve(method, repeats) for method in methods],
+    }
+    Path(output).write_text(json.dumps(results, indent=2))
+    logger.info(f"Wrote benchmark results to {output}")
+    return results
+
+
+def bench_placements(cube_size: int, repeats: int = 3) -> dict:
+    """
+    Time generate_all_placements for every blokk in a cube of cube_size.
+    """
+    blokks = get_blokks()
+    n_placements = sum(
+        len(generate_all_placements(b.voxels, cube_size=cube_size)) for b in blokks
+    )
+    seconds = _best_of(
+        lambda: [
+            generate_all_placements(b.voxels, cube_size=cube_size) for b in blokks
+        ],
+        repeats,
+    )
+    logger.info(f"placements of cube {cube_size}: {n_placements} in {seconds:.3f}s")
+    return {
+        "cube_size": cube_size,
+        "n_placements": n_placements,
+        "seconds": seconds,
+        "placements_per_second": n_placements / seconds,
+    }
+
+
+def bench_samples(cube_size: int, repeats: int = 3) -> dict:
+    """
+    Time generating every sample of the cube, as BlokkSets with
+    generate_all_blokk_samples and as uint64 arrays with generate_blokk_sample_masks.
+    """
+    combinatorics = BlokkCombinatorics(max_blokk_volume=5, cube_size=cube_size)
+    n_samples = combinatorics.count_samples()
+    seconds = _best_of(
+        lambda: sum(1 for _ in combinatorics.generate_all_blokk_samples()), repeats
+    )
+    mask_seconds = _best_of(
+        lambda: sum(len(m) for _, m in combinatorics.generate_blokk_sample_masks()),
+        repeats,
+    )
+    logger.info(
+        f"samples of cube {cube_size}: {n_samples} in {seconds:.3f}s, "
+        f"{mask_seconds:.3f}s as masks"
+    )
+    return {
+        "cube_size": cube_size,
+        "n_samples": n_samples,
+        "seconds": seconds,
+        "samples_per_second": n_samples / seconds,
+        "mask_seconds": mask_seconds,
+        "mask_samples_per_second": n_samples / mask_seconds,
+    }
+
+
+def bench_duckdb(cube_size: int, repeats: int = 3) -> dict:
+    """
+    Time stream_blokk_samples_to_duckdb into a fresh database.
+    """
+    from scripts.sample_to_db import stream_blokk_samples_to_duckdb
+
+    combinatorics = BlokkCombinatorics(max_blokk_volume=5, cube_size=cube_size)
+    n_rows = combinatorics.count_samples()
+    # stream_blokk_samples_to_duckdb sets the level of the root logger
+    loglevel = logging.getLogger().level
+    with tempfile.TemporaryDirectory() as tmp_dir:
+
+        def _stream():
+            stream_blokk_samples_to_duckdb(
+                database=str(Path(tmp_dir) / "benchmark.duckdb"),
+                cube_size=cube_size,
+                max_blokk_volume=5,
+                restart=True,
+                loglevel="WARNING",
+            )
+
+        seconds = _best_of(_stream, repeats)
+    logging.getLogger().setLevel(loglevel)
+    logger.info(f"duckdb rows of cube {cube_size}: {n_rows} in {seconds:.3f}s")
+    return {
+        "cube_size": cube_size,
+        "n_rows": n_rows,
+        "seconds": seconds,
+        "rows_per_second": n_rows / seconds,
+    }
+
+
+def bench_solve(method: str, repeats: int = 3) -> dict:
+    """
+    Time solve_bitmasks on every subset of the corpus with method. The placements
+    are loaded before timing, so only the search is timed.
+    """
+    corpus = solve_corpus()
+    for blokk_ids in corpus:
+        solve_bitmasks(blokk_ids, cube_size=CORPUS_CUBE_SIZE, method=method)
+
+    subsets = []
+    for blokk_ids in corpus:
+
+        def _solve():
+            # so that every run of occupancy_memo starts from nothing
+            DEAD_ENDS.clear()
+            return solve_bitmasks(blokk_ids, cube_size=CORPUS_CUBE_SIZE, method=method)
+
+        subsets.append(
+            {
+                "blokk_ids": list(blokk_ids),
+                "solvable": _solve() is not None,
+                "seconds": _best_of(_solve, repeats),
+            }
+        )
+    seconds = sum(subset["seconds"] for subset in subsets)
+    logger.info(f"solve {len(subsets)} subsets with {method}: {seconds:.3f}s")
+    return {
+        "method": method,
+        "cube_size": CORPUS_CUBE_SIZE,
+        "n_subsets": len(subsets),
+        "n_solvable": sum(subset["solvable"] for subset in subsets),
+        "seconds": seconds,
+        "subsets": subsets,
+    }
+
+
+def solve_corpus() -> list[BlokkSet]:
+    combinatorics = BlokkCombinatorics(max_blokk_volume=5, cube_size=CORPUS_CUBE_SIZE)
+    keys = combinatorics.generate_shape_class_samples()
+    return [
+        shape_class_representative(key)
+        for _, key in islice(keys, 0, None, CORPUS_STRIDE)
+    ]
+
+
+def compare_benchmarks(baseline, current, threshold=1.2) -> dict[str, float]:
+    """
+    Compare two result files of run_benchmarks, and return the ratio of current to
+    baseline seconds for every timing in both. Ratios above threshold are logged as
+    regressions, below 1 / threshold as improvements.
+    """
+    baseline_seconds = _flatten_seconds(json.loads(Path(baseline).read_text()))
+    current_seconds = _flatten_seconds(json.loads(Path(current).read_text()))
+    ratios = {
+        name: current_seconds[name] / baseline_seconds[name]
+        for name in baseline_seconds
+        if name in current_seconds
+    }
+    for name, ratio in ratios.items():
+        if ratio > threshold:
+            logger.warning(f"{name}: {ratio:.2f}x slower")
+        elif ratio < 1 / threshold:
+            logger.info(f"{name}: {1 / ratio:.2f}x faster")
+    return ratios
+
+
+def _flatten_seconds(results: dict) -> dict[str, float]:
+    # one name per timing, e.g. "solve/occupancy" or "placements/cube_3"
+    seconds = {
+        f"placements/cube_{r['cube_size']}": r["seconds"] for r in results["placements"]
+    }
+    seconds["samples"] = results["samples"]["seconds"]
+    seconds["samples/masks"] = results["samples"]["mask_seconds"]
+    seconds["duckdb"] = results["duckdb"]["seconds"]
+    for r in results["solve"]:
+        seconds[f"solve/{r['method']}"] = r["seconds"]
+    return seconds
+
+
+def _best_of(fn: Callable, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _meta(repeats: int) -> dict:
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "repeats": repeats,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    run_benchmarks()
@@ -0,0 +1,141 @@
+import logging
+from functools import cache
+from typing import Iterable
+
+import numpy as np
+
+from blokk_solver.geometry import VoxelType, all_rotation_matrices
+
+logger = logging.getLogger(__name__)
+
+# Each placement is a bitmask over the cube_size**3 cells of the board. The cell
+# (x, y, z) is bit x*n*n + y*n + z, the same order as a flattened game board.
+WORD_BITS = 64
+
+
+def voxel_to_cell(voxel: VoxelType, cube_size: int) -> int:
+    """
+    Return the index of a voxel in the flattened cube_size x cube_size x cube_size board.
+    """
+    x, y, z = map(int, voxel)
+    return (x * cube_size + y) * cube_size + z
+
+
+def cell_to_voxel(cell: int, cube_size: int) -> VoxelType:
+    """
+    Inverse of voxel_to_cell.
+    """
+    xy, z = divmod(cell, cube_size)
+    x, y = divmod(xy, cube_size)
+    return (x, y, z)
+
+
+def n_words(cube_size: int) -> int:
+    """
+    Number of uint64 words needed to hold one placement of a cube_size board.
+    """
+    return -(-(cube_size**3) // WORD_BITS)
+
+
+def full_bitmask(cube_size: int) -> int:
+    """
+    The bitmask with every cell of the board set.
+    """
+    return (1 << cube_size**3) - 1
+
+
+def placement_to_bitmask(placement: Iterable[VoxelType], cube_size: int) -> int:
+    """
+    Encode a placement (a set of voxels) as a python integer bitmask.
+    """
+    mask = 0
+    for voxel in placement:
+        mask |= 1 << voxel_to_cell(voxel, cube_size)
+    return mask
+
+
+def bitmask_to_placement(mask: int, cube_size: int) -> frozenset[VoxelType]:
+    """
+    Decode a python integer bitmask back into a set of voxels.
+    """
+    voxels = []
+    while mask:
+        low_bit = mask & -mask
+        voxels.append(cell_to_voxel(low_bit.bit_length() - 1, cube_size))
+        mask ^= low_bit
+    return frozenset(voxels)
+
+
+def cells_to_bitboards(cells: np.ndarray, cube_size: int) -> np.ndarray:
+    """
+    Encode a (n_placements, volume) matrix of cell indices as a (n_placements, n_words)
+    uint64 array. Boards with up to 64 cells (cube_size <= 4) need a single word, a
+    5x5x5 board needs two.
+    """
+    cells = np.asarray(cells, dtype=np.uint64)
+    words, bits = np.divmod(cells, np.uint64(WORD_BITS))
+    bitboards = np.zeros((len(cells), n_words(cube_size)), dtype=np.uint64)
+    for word in range(bitboards.shape[1]):
+        word_bits = np.where(words == word, np.uint64(1) << bits, np.uint64(0))
+        bitboards[:, word] = np.bitwise_or.reduce(word_bits, axis=1)
+    return bitboards
+
+
+def bitboard_to_bitmask(bitboard: np.ndarray) -> int:
+    """
+    Convert one row of a bitboard array into a python integer bitmask.
+    """
+    mask = 0
+    for word_idx, word in enumerate(bitboard):
+        mask |= int(word) << (word_idx * WORD_BITS)
+    return mask
+
+
+def bitmasks_to_bitboards(masks: Iterable[int], cube_size: int) -> np.ndarray:
+    """
+    Encode python integer bitmasks as a (n_masks, n_words) uint64 array, the inverse
+    of bitboard_to_bitmask.
+    """
+    masks = list(masks)
+    word_mask = (1 << WORD_BITS) - 1
+    bitboards = np.zeros((len(masks), n_words(cube_size)), dtype=np.uint64)
+    for word in range(bitboards.shape[1]):
+        bitboards[:, word] = [mask >> (word * WORD_BITS) & word_mask for mask in masks]
+    return bitboards
+
+
+@cache
+def cell_rotations(cube_size: int) -> tuple[tuple[int, ...], ...]:
+    """
+    For each of the 24 rotations of the cube about its centre, the cell that every
+    cell is rotated onto. The identity comes first.
+    """
+    cells = np.array([cell_to_voxel(c, cube_size) for c in range(cube_size**3)])
+    # double the coordinates so that the centre of the cube is an integer
+    centred = 2 * cells - (cube_size - 1)
+    rotations = []
+    for matrix in all_rotation_matrices():
+        rotated = (centred @ matrix.T + (cube_size - 1)) // 2
+        rotations.append(tuple(voxel_to_cell(v, cube_size) for v in rotated))
+    identity = tuple(range(cube_size**3))
+    return (identity, *(r for r in rotations if r != identity))
+
+
+def rotate_bitmask(mask: int, rotation: tuple[int, ...]) -> int:
+    """
+    Rotate a bitmask with one of the cell permutations from cell_rotations.
+    """
+    rotated = 0
+    while mask:
+        low_bit = mask & -mask
+        rotated |= 1 << rotation[low_bit.bit_length() - 1]
+        mask ^= low_bit
+    return rotated
+
+
+def overlaps(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Test bitboards for overlap with a single AND across the word axis. Broadcasts, so
+    one placement can be tested against many at once.
+    """
+    return np.any(a & b, axis=-1)
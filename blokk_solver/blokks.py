@@ -1,41 +1,169 @@
-from collections import defaultdict
-from dataclasses import dataclass
-from typing import FrozenSet, Iterable, Optional
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from functools import cache
+from types import MappingProxyType
+from typing import FrozenSet, Iterable, Iterator, Optional
 
 import numpy as np
 
 from blokk_solver._blokk_data import blokk_data
-from blokk_solver.geometry import VoxelType, generate_all_placements
+from blokk_solver.bitboard import cell_to_voxel
+from blokk_solver.geometry import VoxelType, canonical_shape
+from blokk_solver.placement_cache import get_placement_cells
 
 # thanks copilot :doge:
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Blokk:
     id: int
     name: str
     color: str
     volume: int
     voxels: FrozenSet[VoxelType]
-    max_length: int = 0
+    max_length: int = field(init=False)
 
     def __post_init__(self):
-        self.max_length = max([coord for point in self.voxels for coord in point]) + 1
+        max_length = max([coord for point in self.voxels for coord in point]) + 1
+        object.__setattr__(self, "max_length", max_length)
+
+
+@dataclass(frozen=True, slots=True)
+class BlokkRegistry:
+    """
+    Every blokk, built once, with its properties precomputed as read-only arrays
+    indexed by blokk id, so they line up with the bits of a BlokkSet. Index 0 is not
+    a blokk and holds zeros. Get the one registry with get_registry().
+    """
+
+    blokks: tuple[Blokk, ...]
+    by_id: MappingProxyType[int, Blokk]
+    # (max id + 1,) arrays
+    volumes: np.ndarray
+    max_lengths: np.ndarray
+    shape_classes: np.ndarray
+    # (max id + 1, 3) size of each blokk's bounding box along x, y and z
+    bounding_boxes: np.ndarray
+    # (volume, 3) voxel coordinates of each blokk
+    voxels: tuple[np.ndarray, ...]
+
+    @classmethod
+    def from_data(cls, data: Iterable[dict]) -> "BlokkRegistry":
+        blokks = tuple(sorted((Blokk(**d) for d in data), key=lambda b: b.id))
+        size = blokks[-1].id + 1
+        volumes = np.zeros(size, dtype=np.int64)
+        max_lengths = np.zeros(size, dtype=np.int64)
+        shape_classes = np.zeros(size, dtype=np.int64)
+        bounding_boxes = np.zeros((size, 3), dtype=np.int64)
+        # the smallest id of a blokk with the same shape up to rotation
+        shape_to_class: dict[tuple[VoxelType, ...], int] = {}
+        voxels = [np.zeros((0, 3), dtype=np.int64)] * size
+        for blokk in blokks:
+            blokk_voxels = np.array(sorted(blokk.voxels), dtype=np.int64)
+            volumes[blokk.id] = blokk.volume
+            max_lengths[blokk.id] = blokk.max_length
+            bounding_boxes[blokk.id] = blokk_voxels.max(axis=0) + 1
+            shape_classes[blokk.id] = shape_to_class.setdefault(
+                canonical_shape(blokk.voxels), blokk.id
+            )
+            voxels[blokk.id] = blokk_voxels
+        arrays = [volumes, max_lengths, shape_classes, bounding_boxes, *voxels]
+        for array in arrays:
+            array.setflags(write=False)
+        return cls(
+            blokks=blokks,
+            by_id=MappingProxyType({blokk.id: blokk for blokk in blokks}),
+            volumes=volumes,
+            max_lengths=max_lengths,
+            shape_classes=shape_classes,
+            bounding_boxes=bounding_boxes,
+            voxels=tuple(voxels),
+        )
+
+
+class BlokkSet(int):
+    """
+    A set of blokk ids, as an integer with bit blokk_id set for each id. The 36
+    blokks fit in a uint64, so a BlokkSet hashes and compares as fast as an int, is
+    stored in DuckDB and Parquet as a UBIGINT, and set operations are single bitwise
+    operations. Iterating yields the ids in ascending order.
+
+    Only |, &, ^ and -, from either side, and issubset are set operations. Every
+    other operator is the int's: < and <= compare the bitmasks as numbers, not as
+    subsets, and +, ~ and the like return plain ints.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_ids(cls, blokk_ids: Iterable[int]) -> "BlokkSet":
+        mask = 0
+        for blokk_id in blokk_ids:
+            mask |= 1 << int(blokk_id)
+        return cls(mask)
+
+    def __iter__(self) -> Iterator[int]:
+        mask = int(self)
+        while mask:
+            low_bit = mask & -mask
+            yield low_bit.bit_length() - 1
+            mask ^= low_bit
+
+    def __len__(self) -> int:
+        return self.bit_count()
+
+    def __contains__(self, blokk_id: int) -> bool:
+        return blokk_id >= 0 and bool(int(self) >> blokk_id & 1)
+
+    def __or__(self, other: int) -> "BlokkSet":
+        return BlokkSet(int(self) | int(other))
+
+    def __and__(self, other: int) -> "BlokkSet":
+        return BlokkSet(int(self) & int(other))
+
+    def __xor__(self, other: int) -> "BlokkSet":
+        return BlokkSet(int(self) ^ int(other))
+
+    def __sub__(self, other: int) -> "BlokkSet":
+        return BlokkSet(int(self) & ~int(other))
+
+    __ror__ = __or__
+    __rand__ = __and__
+    __rxor__ = __xor__
+
+    def __rsub__(self, other: int) -> "BlokkSet":
+        return BlokkSet(int(other) & ~int(self))
+
+    def issubset(self, other: int) -> bool:
+        return int(self) & ~int(other) == 0
+
+    def __repr__(self) -> str:
+        return f"BlokkSet({list(self)})"
+
+
+@cache
+def get_registry() -> BlokkRegistry:
+    return BlokkRegistry.from_data(blokk_data)
+
+
+def get_blokk(blokk_id: int) -> Blokk:
+    return get_registry().by_id[blokk_id]
 
 
 def get_blokks(ids: Optional[Iterable[int]] = None) -> list[Blokk]:
-    all_blokks = [Blokk(**data) for data in blokk_data]
-    if ids is not None:
-        ids_set = set(ids)
-        return [b for b in all_blokks if b.id in ids_set]
-    return all_blokks
+    registry = get_registry()
+    if ids is None:
+        return list(registry.blokks)
+    # in id order, skipping ids that are not blokks
+    by_id = registry.by_id
+    return [by_id[i] for i in sorted(set(ids)) if i in by_id]
 
 
 def get_volume_to_ids(
     cube_size: Optional[int] = None, max_blokk_volume=None
 ) -> dict[int, set[int]]:
     volume_to_ids = defaultdict(set)
-    for blokk in get_blokks():
+    for blokk in get_registry().blokks:
         if cube_size is not None and blokk.max_length > cube_size:
             continue
         if max_blokk_volume is not None and blokk.volume > max_blokk_volume:
@@ -44,14 +172,59 @@ def get_volume_to_ids(
     return volume_to_ids
 
 
+@cache
+def get_id_to_shape_class() -> dict[int, int]:
+    """
+    Map each blokk id to its shape class: the smallest id of a blokk with the same
+    shape up to rotation. Blokks of one shape class have the same placements.
+    """
+    registry = get_registry()
+    return {
+        blokk.id: int(registry.shape_classes[blokk.id]) for blokk in registry.blokks
+    }
+
+
+def shape_class_key(blokk_ids: Iterable[int]) -> tuple[tuple[int, int], ...]:
+    """
+    The multiset of shape classes of some blokks, as sorted (shape class, count)
+    pairs. Blokk subsets with the same key are the same puzzle.
+    """
+    id_to_shape_class = get_id_to_shape_class()
+    return tuple(sorted(Counter(id_to_shape_class[i] for i in blokk_ids).items()))
+
+
+def shape_class_representative(key: tuple[tuple[int, int], ...]) -> BlokkSet:
+    """
+    One blokk sample with the multiset of shapes given by a shape_class_key.
+    """
+    class_to_ids = defaultdict(list)
+    for blokk_id, shape_class in sorted(get_id_to_shape_class().items()):
+        class_to_ids[shape_class].append(blokk_id)
+    return BlokkSet.from_ids(i for c, n in key for i in class_to_ids[c][:n])
+
+
 def get_id_to_placements(cube_size=5) -> dict[int, set[frozenset[VoxelType]]]:
     id_to_placements = {}
-    for blokk in get_blokks():
-        placements = generate_all_placements(blokk.voxels, cube_size=cube_size)
-        id_to_placements[blokk.id] = placements
+    for blokk_id, cells in get_id_to_placement_cells(cube_size=cube_size).items():
+        placements = {
+            frozenset(cell_to_voxel(int(cell), cube_size) for cell in row)
+            for row in cells
+        }
+        id_to_placements[blokk_id] = placements
     return id_to_placements
 
 
+def get_id_to_placement_cells(cube_size=5) -> dict[int, np.ndarray]:
+    """
+    Each blokk's placements as a (n_placements, volume) matrix of cell indices, loaded
+    from the placement cache.
+    """
+    return {
+        blokk.id: get_placement_cells(blokk.voxels, cube_size=cube_size)
+        for blokk in get_blokks()
+    }
+
+
 def shape_to_game_board(
     shape: FrozenSet[VoxelType], n: int, flatten: bool = False
 ) -> np.ndarray:
@@ -1,10 +1,14 @@
 import logging
+from bisect import bisect_right
 from collections import Counter
-from itertools import chain, combinations, product
-from typing import Generator
+from functools import cached_property
+from itertools import accumulate, chain, combinations, islice, product
+from math import comb, prod
+from typing import Generator, Optional
 
-from blokk_solver.blokks import get_volume_to_ids
-from pads.IntegerPartition import mckay
+import numpy as np
+
+from blokk_solver.blokks import BlokkSet, get_id_to_shape_class, get_volume_to_ids
 
 logger = logging.getLogger(__name__)
 
@@ -16,10 +20,100 @@ class BlokkCombinatorics:
         self.volume_to_ids = get_volume_to_ids(
             cube_size=cube_size, max_blokk_volume=max_blokk_volume
         )
+        # the available blokks of each volume, grouped by shape up to rotation
+        id_to_shape_class = get_id_to_shape_class()
+        self.volume_to_shape_classes: dict[int, dict[int, list[int]]] = {}
+        for v, ids in self.volume_to_ids.items():
+            shape_classes = self.volume_to_shape_classes.setdefault(v, {})
+            for i in sorted(ids):
+                shape_classes.setdefault(id_to_shape_class[i], []).append(i)
+
+    def generate_integer_partitions(self) -> Generator[list[int]]:
+        """
+        Yield the integer partitions of cube_size**3 that can be sampled at all: each
+        part is the volume of an available blokk, used at most as often as there are
+        blokks of that volume. Partitions come in the same reverse lexicographic order
+        as mckay, which would otherwise walk every partition of cube_size**3.
+        """
+        max_multiplicity = {v: len(ids) for v, ids in self.volume_to_ids.items()}
+        return generate_bounded_partitions(self.cube_size**3, max_multiplicity)
+
+    def count_samples(self) -> int:
+        """
+        The number of samples generate_all_blokk_samples yields, without generating
+        them: the coefficient of x**(cube_size**3) in the generating function
+        prod_v (1 + x**v)**len(volume_to_ids[v]).
+        """
+        n = self.cube_size**3
+        # ways[t] is the number of blokk subsets seen so far with total volume t
+        ways = [1] + [0] * n
+        for v, ids in self.volume_to_ids.items():
+            new_ways = [0] * (n + 1)
+            for t, w in enumerate(ways):
+                if w == 0:
+                    continue
+                for k in range(min(len(ids), (n - t) // v) + 1):
+                    new_ways[t + k * v] += w * comb(len(ids), k)
+            ways = new_ways
+        return ways[n]
+
+    def count_samples_per_integer_partition(self) -> list[int]:
+        """
+        The number of samples of each integer partition, indexed like
+        integer_partition_idx: the product over volumes of the ways to choose
+        that many blokks of that volume.
+        """
+        return [
+            prod(comb(len(self.volume_to_ids[v]), n) for v, n in Counter(p).items())
+            for p in self.generate_integer_partitions()
+        ]
+
+    def locate_sample(self, sample_idx: int) -> tuple[int, int]:
+        """
+        Map the position of a sample in generate_all_blokk_samples (counting from 0)
+        to its (integer_partition_idx, position within that partition), to plan,
+        shard and track runs before any sample is generated.
+        """
+        if not 0 <= sample_idx < self._cumulative_sample_counts[-1]:
+            raise IndexError(f"sample_idx {sample_idx} out of range")
+        integer_partition_idx = (
+            bisect_right(self._cumulative_sample_counts, sample_idx) - 1
+        )
+        offset = sample_idx - self._cumulative_sample_counts[integer_partition_idx]
+        return integer_partition_idx, offset
+
+    def shard_sample_range(self, shard: int, num_shards: int) -> tuple[int, int]:
+        """
+        The [start, stop) positions in generate_all_blokk_samples of the samples of
+        shard. The samples are split into num_shards contiguous ranges that differ
+        in size by at most one sample, however uneven the integer partitions are.
+        """
+        if not 0 <= shard < num_shards:
+            raise ValueError(f"shard must be in [0, {num_shards}), got {shard}")
+        n_samples = self._cumulative_sample_counts[-1]
+        return shard * n_samples // num_shards, (shard + 1) * n_samples // num_shards
+
+    @cached_property
+    def _cumulative_sample_counts(self) -> list[int]:
+        return list(accumulate(self.count_samples_per_integer_partition(), initial=0))
 
     def generate_blokk_samples_from_integer_partition(
         self, integer_partition: list[int]
-    ) -> Generator[frozenset[int]]:
+    ) -> Generator[BlokkSet]:
+        v_to_samples = self._volume_samples(integer_partition)
+        if v_to_samples is None:
+            return None
+
+        # generate cartesian product of n ways for each volume v
+        plays = product(*v_to_samples.values())
+        for play in plays:
+            # flatten from [[(ids with v1), (ids with v2), ...], ...]
+            # to [ids, ...]
+            yield BlokkSet.from_ids(chain.from_iterable(play))
+
+    def _volume_samples(
+        self, integer_partition: list[int]
+    ) -> Optional[dict[int, set[tuple[int]]]]:
         # the number of blokks (n) needed per blokk volume (volume)
         v_to_n: dict[int, int] = Counter(integer_partition)
 
@@ -31,26 +125,189 @@ class BlokkCombinatorics:
                 return None
             samples = set(combinations(self.volume_to_ids[v], r=n))
             v_to_samples[v] = samples
+        return v_to_samples
 
-        # generate cartesian product of n ways for each volume v
-        plays = product(*v_to_samples.values())
-        for play in plays:
-            # flatten from [[(ids with v1), (ids with v2), ...], ...]
-            # to [ids, ...]
-            yield frozenset(chain.from_iterable(play))
+    def generate_shape_class_samples(
+        self,
+    ) -> Generator[tuple[int, tuple[tuple[int, int], ...]]]:
+        """
+        Yield (integer_partition_idx, key) for every distinct multiset of blokk shapes
+        whose volumes sum to cube_volume, where key is a sorted tuple of
+        (shape class, count) pairs as returned by blokks.shape_class_key. Each key
+        stands for all the blokk samples expand_shape_class_sample yields, which are
+        the same puzzle.
+        """
+        for idx, integer_partition in enumerate(self.generate_integer_partitions()):
+            # all ways to spread the n blokks of volume v over its shape classes
+            v_to_class_counts = [
+                list(_bounded_compositions(n, self.volume_to_shape_classes[v]))
+                for v, n in Counter(integer_partition).items()
+            ]
+            for class_counts in product(*v_to_class_counts):
+                yield idx, tuple(sorted(chain.from_iterable(class_counts)))
 
-    def generate_all_blokk_samples(self) -> Generator[tuple[int, frozenset[int]]]:
+    def expand_shape_class_sample(
+        self, key: tuple[tuple[int, int], ...]
+    ) -> Generator[BlokkSet]:
+        """
+        Yield every blokk sample with the multiset of shapes given by key.
+        """
+        class_to_ids = {
+            shape_class: ids
+            for shape_classes in self.volume_to_shape_classes.values()
+            for shape_class, ids in shape_classes.items()
+        }
+        for play in product(*(combinations(class_to_ids[c], r=n) for c, n in key)):
+            yield BlokkSet.from_ids(chain.from_iterable(play))
+
+    def generate_all_blokk_samples(
+        self,
+        start_integer_partition_idx: int = 0,
+        stop_integer_partition_idx: Optional[int] = None,
+        shard: int = 0,
+        num_shards: int = 1,
+    ) -> Generator[tuple[int, BlokkSet]]:
         """
         Yield all unique sets of blokk IDs whose volumes sum to cube_volume,
         using only blokks with volume <= max_volume.
+
+        Integer partitions are numbered in the order of generate_integer_partitions.
+        Only integer partitions with start_integer_partition_idx <= idx <
+        stop_integer_partition_idx are sampled, to resume an interrupted run or
+        split the work by range. The work can also be split into num_shards shards
+        of nearly equal size, of which only the samples in shard_sample_range are
+        sampled; a shard can start or end part way through an integer partition.
+        """
+        for idx, integer_partition, start, stop in self._select_sample_ranges(
+            start_integer_partition_idx, stop_integer_partition_idx, shard, num_shards
+        ):
+            # loop through the ways to sample that partition, within the range
+            for blokk_sample in islice(
+                self.generate_blokk_samples_from_integer_partition(integer_partition),
+                start,
+                stop,
+            ):
+                yield (idx, blokk_sample)
+
+    def generate_blokk_sample_masks(
+        self,
+        start_integer_partition_idx: int = 0,
+        stop_integer_partition_idx: Optional[int] = None,
+        shard: int = 0,
+        num_shards: int = 1,
+        chunk_size: int = 1 << 20,
+    ) -> Generator[tuple[int, np.ndarray]]:
         """
+        The samples of generate_all_blokk_samples, in the same order, as
+        (integer_partition_idx, masks) chunks where masks is a uint64 array of up to
+        chunk_size BlokkSet bitmasks.
 
-        # loop through integer partitions
-        integer_partitions = mckay(self.cube_size**3)
+        Each partition's samples are numbered like the cartesian product they come
+        from, and built a chunk at a time by ORing together the bitmasks of the
+        blokks of each volume, so no sample is ever a python object.
+        """
+        for idx, integer_partition, start, stop in self._select_sample_ranges(
+            start_integer_partition_idx, stop_integer_partition_idx, shard, num_shards
+        ):
+            v_to_samples = self._volume_samples(integer_partition)
+            v_masks = [
+                np.array([BlokkSet.from_ids(s) for s in samples], dtype=np.uint64)
+                for samples in v_to_samples.values()
+            ]
+            shape = [len(masks) for masks in v_masks]
+            for chunk_start in range(start, stop, chunk_size):
+                sample_idx = np.arange(chunk_start, min(chunk_start + chunk_size, stop))
+                v_idx = np.unravel_index(sample_idx, shape)
+                yield (
+                    idx,
+                    np.bitwise_or.reduce(
+                        [masks[i] for masks, i in zip(v_masks, v_idx)], axis=0
+                    ),
+                )
+
+    def _select_sample_ranges(
+        self,
+        start_integer_partition_idx: int,
+        stop_integer_partition_idx: Optional[int],
+        shard: int,
+        num_shards: int,
+    ) -> Generator[tuple[int, list[int], int, int]]:
+        # the (integer_partition_idx, integer_partition, start, stop) of each integer
+        # partition with samples in the shard, where [start, stop) are the positions
+        # of those samples within the partition
+        shard_start, shard_stop = self.shard_sample_range(shard, num_shards)
+        if shard_start == shard_stop:
+            return
+        first_idx, first_offset = self.locate_sample(shard_start)
+        last_idx, last_offset = self.locate_sample(shard_stop - 1)
+        counts = self.count_samples_per_integer_partition()
+
+        integer_partitions = self.generate_integer_partitions()
         for idx, integer_partition in enumerate(integer_partitions):
-            # loop through all possible ways to sample that partition
-            for blokk_sample in self.generate_blokk_samples_from_integer_partition(
-                integer_partition
-            ):
-                if blokk_sample is not None:
-                    yield (idx, blokk_sample)
+            if idx < max(first_idx, start_integer_partition_idx):
+                continue
+            if idx > last_idx:
+                return
+            if stop_integer_partition_idx is not None:
+                if idx >= stop_integer_partition_idx:
+                    return
+            start = first_offset if idx == first_idx else 0
+            stop = last_offset + 1 if idx == last_idx else counts[idx]
+            yield idx, integer_partition, start, stop
+
+
+def _bounded_compositions(
+    n: int, shape_classes: dict[int, list[int]]
+) -> Generator[tuple[tuple[int, int], ...]]:
+    # ways to pick n blokks from shape classes, as (shape class, count) pairs with
+    # count <= the number of blokks in that class
+    classes = list(shape_classes.items())
+
+    def _extend(remaining: int, i: int, picked: list[tuple[int, int]]):
+        if remaining == 0:
+            yield tuple(picked)
+            return
+        if i == len(classes):
+            return
+        shape_class, ids = classes[i]
+        for k in range(min(len(ids), remaining), -1, -1):
+            if k:
+                picked.append((shape_class, k))
+            yield from _extend(remaining - k, i + 1, picked)
+            if k:
+                picked.pop()
+
+    yield from _extend(n, 0, [])
+
+
+def generate_bounded_partitions(
+    n: int, max_multiplicity: dict[int, int]
+) -> Generator[list[int]]:
+    """
+    Yield the integer partitions of n whose parts are keys of max_multiplicity, each
+    used at most max_multiplicity[part] times, in reverse lexicographic order.
+
+    Equivalent to filtering mckay(n), but branches that cannot reach n are never
+    entered, so the cost is proportional to the partitions yielded.
+    """
+    parts = sorted(
+        (v for v, m in max_multiplicity.items() if v > 0 and m > 0), reverse=True
+    )
+    # the largest volume the parts from parts[i:] onwards can still add up to
+    capacity = [0] * (len(parts) + 1)
+    for i in reversed(range(len(parts))):
+        capacity[i] = capacity[i + 1] + parts[i] * max_multiplicity[parts[i]]
+
+    def _extend(remaining: int, i: int, partition: list[int]):
+        if remaining == 0:
+            yield list(partition)
+            return
+        if capacity[i] < remaining:
+            return
+        part = parts[i]
+        for k in range(min(max_multiplicity[part], remaining // part), -1, -1):
+            partition.extend([part] * k)
+            yield from _extend(remaining - part * k, i + 1, partition)
+            del partition[len(partition) - k :]
+
+    yield from _extend(n, 0, [])
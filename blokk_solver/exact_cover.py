@@ -0,0 +1,68 @@
+import logging
+from typing import Generator, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+def build_columns(
+    rows: dict[Hashable, list[Hashable]],
+) -> dict[Hashable, set[Hashable]]:
+    """
+    Invert rows -> columns into columns -> rows, the form algorithm_x works on.
+    """
+    columns: dict[Hashable, set[Hashable]] = {}
+    for row, row_columns in rows.items():
+        for column in row_columns:
+            columns.setdefault(column, set()).add(row)
+    return columns
+
+
+def algorithm_x(
+    columns: dict[Hashable, set[Hashable]],
+    rows: dict[Hashable, list[Hashable]],
+    partial: list[Hashable] | None = None,
+) -> Generator[list[Hashable]]:
+    """
+    Knuth's Algorithm X, yielding every set of rows that covers each column exactly once.
+
+    The linked lists of Dancing Links are replaced by a dict of sets, which gives
+    the same cheap cover/uncover in python. At each step the column with the fewest
+    candidate rows is branched on, so dead ends are found as early as possible.
+
+    `columns` is modified during the search, and restored when the search ends or
+    the generator is closed, so also when a consumer stops early and drops it.
+    """
+    if partial is None:
+        partial = []
+    if not columns:
+        yield list(partial)
+        return
+    column = min(columns, key=lambda c: len(columns[c]))
+    for row in list(columns[column]):
+        partial.append(row)
+        removed = _cover(columns, rows, row)
+        try:
+            yield from algorithm_x(columns, rows, partial)
+        finally:
+            _uncover(columns, rows, row, removed)
+            partial.pop()
+
+
+def _cover(columns, rows, row) -> list[set[Hashable]]:
+    removed = []
+    for column in rows[row]:
+        for other_row in columns[column]:
+            for other_column in rows[other_row]:
+                if other_column != column:
+                    columns[other_column].remove(other_row)
+        removed.append(columns.pop(column))
+    return removed
+
+
+def _uncover(columns, rows, row, removed) -> None:
+    for column in reversed(rows[row]):
+        columns[column] = removed.pop()
+        for other_row in columns[column]:
+            for other_column in rows[other_row]:
+                if other_column != column:
+                    columns[other_column].add(other_row)
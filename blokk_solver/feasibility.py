@@ -0,0 +1,121 @@
+import logging
+from functools import cache, lru_cache
+from typing import Generator, Iterable
+
+from blokk_solver.bitboard import cell_to_voxel, full_bitmask
+
+logger = logging.getLogger(__name__)
+
+
+def is_feasible(id_to_masks: dict[int, tuple[int, ...]], cube_size: int) -> bool:
+    """
+    Cheap necessary conditions for the blokks to fill the cube, checked before any
+    search:
+        volume: the blokk volumes add up to the volume of the cube
+        fit: every blokk has at least one placement, i.e. fits along every axis
+        parity: colour the cube like a checkerboard, then each placement covers a
+            fixed surplus of one colour, and some choice of surpluses must add up to
+            the surplus of the cube
+    """
+    if not all(id_to_masks.values()):
+        return False
+    volume = sum(masks[0].bit_count() for masks in id_to_masks.values())
+    if volume != cube_size**3:
+        return False
+
+    # the set of reachable colour surpluses, as a bitset offset by the cube volume
+    offset = cube_size**3
+    reachable = 1 << offset
+    for masks in id_to_masks.values():
+        reachable = _or_shifted(reachable, _parity_imbalances(masks, cube_size))
+    target = parity_imbalance(full_bitmask(cube_size), cube_size)
+    return bool(reachable >> (offset + target) & 1)
+
+
+def parity_imbalance(mask: int, cube_size: int) -> int:
+    """
+    The number of even cells minus the number of odd cells of a bitmask, where a cell
+    (x, y, z) is even when x + y + z is.
+    """
+    even = (mask & _even_cells(cube_size)).bit_count()
+    return 2 * even - mask.bit_count()
+
+
+def empty_regions(occupied: int, cube_size: int) -> Generator[int]:
+    """
+    Yield the connected regions of empty cells as bitmasks, cells being connected
+    when they share a face.
+    """
+    n = cube_size
+    not_z_first, not_z_last, not_y_first, not_y_last, full = _neighbour_masks(n)
+    empty = ~occupied & full
+    while empty:
+        region = empty & -empty
+        while True:
+            # grow the region by one cell along each axis, without wrapping around
+            # the faces of the cube
+            grown = (
+                region
+                | (region & not_z_last) << 1
+                | (region & not_z_first) >> 1
+                | (region & not_y_last) << n
+                | (region & not_y_first) >> n
+                | region << n * n
+                | region >> n * n
+            ) & empty
+            if grown == region:
+                break
+            region = grown
+        yield region
+        empty &= ~region
+
+
+def regions_fillable(occupied: int, volumes: Iterable[int], cube_size: int) -> bool:
+    """
+    False when some empty region cannot be filled exactly, because no subset of the
+    remaining blokk volumes adds up to its size.
+    """
+    subset_sums = 1
+    for volume in volumes:
+        subset_sums |= subset_sums << volume
+    return all(
+        subset_sums >> region.bit_count() & 1
+        for region in empty_regions(occupied, cube_size)
+    )
+
+
+def _or_shifted(bitset: int, shifts: Iterable[int]) -> int:
+    result = 0
+    for shift in shifts:
+        result |= bitset << shift if shift >= 0 else bitset >> -shift
+    return result
+
+
+@lru_cache(maxsize=1024)
+def _parity_imbalances(masks: tuple[int, ...], cube_size: int) -> frozenset[int]:
+    return frozenset(parity_imbalance(mask, cube_size) for mask in masks)
+
+
+@cache
+def _neighbour_masks(cube_size: int) -> tuple[int, int, int, int, int]:
+    # the cells that are not on the faces z == 0, z == n - 1, y == 0 and y == n - 1,
+    # and every cell
+    n = cube_size
+    full = full_bitmask(n)
+    faces = [0, 0, 0, 0]
+    for cell in range(n**3):
+        _, y, z = cell_to_voxel(cell, n)
+        faces[0] |= (z == 0) << cell
+        faces[1] |= (z == n - 1) << cell
+        faces[2] |= (y == 0) << cell
+        faces[3] |= (y == n - 1) << cell
+    return (*(full & ~face for face in faces), full)
+
+
+@cache
+def _even_cells(cube_size: int) -> int:
+    return sum(
+        1 << cell
+        for cell in range(cube_size**3)
+        if sum(cell_to_voxel(cell, cube_size)) % 2 == 0
+    )
@@ -1,8 +1,9 @@
 import logging
+from functools import cache
+from itertools import permutations, product
 from typing import TypeAlias
 
 import numpy as np
-from scipy.spatial.transform import Rotation as R
 
 VoxelType: TypeAlias = tuple[int, int, int]
 
@@ -12,11 +13,24 @@ logger = logging.getLogger(__name__)
 def all_rotation_matrices() -> list[np.ndarray]:
     """
     Return all 24 proper rotation matrices of the cube (octahedral group, no reflections).
-    Each matrix is a 3x3 numpy array of dtype int.
+    Each matrix is a 3x3 numpy array of dtype int. The identity comes first.
     """
-    rots = R.create_group("O")
-    # Ensure all matrices are integer-valued
-    return [np.round(rot.as_matrix()).astype(int) for rot in rots]
+    return list(_rotation_matrices())
+
+
+@cache
+def _rotation_matrices() -> tuple[np.ndarray, ...]:
+    # the signed permutation matrices with determinant 1: every way to map the axes
+    # onto the axes, either way round, that is not a reflection
+    matrices = []
+    for axes in permutations(range(3)):
+        for signs in product((1, -1), repeat=3):
+            matrix = np.zeros((3, 3), dtype=int)
+            matrix[range(3), axes] = signs
+            if round(np.linalg.det(matrix)) == 1:
+                matrix.setflags(write=False)
+                matrices.append(matrix)
+    return tuple(matrices)
 
 
 def normalize_shape(voxels: frozenset[VoxelType]) -> frozenset[VoxelType]:
@@ -28,6 +42,17 @@ def normalize_shape(voxels: frozenset[VoxelType]) -> frozenset[VoxelType]:
     return frozenset([(x - min_x, y - min_y, z - min_z) for (x, y, z) in voxels])
 
 
+def canonical_shape(voxels: frozenset[VoxelType]) -> tuple[VoxelType, ...]:
+    """
+    Return a canonical form of a blokk shape that is the same for all of its rotations:
+    the lexicographically smallest sorted tuple of voxels among its normalized rotations.
+    """
+    return min(
+        tuple(sorted(tuple(map(int, voxel)) for voxel in rotation))
+        for rotation in generate_rotations(voxels)
+    )
+
+
 def generate_rotations(
     voxels: frozenset[VoxelType],
 ) -> set[frozenset[VoxelType]]:
@@ -79,11 +104,59 @@ def generate_all_placements(
     Return all unique placements of a blokk within a cube_size x cube_size x cube_size grid,
     considering all rotations and translations.
     """
-    rotations = generate_rotations(voxels)
-    placements = set()
-    for rotation in rotations:
-        translations = generate_translations(rotation, cube_size=cube_size)
-        placements.update(translations)
-    # Remove duplicates
-    print(f"generated {len(rotations)} rotations = {len(placements)} unique placements")
+    placement_matrix = generate_placement_matrix(voxels, cube_size=cube_size)
+    xs, rest = np.divmod(placement_matrix, cube_size * cube_size)
+    ys, zs = np.divmod(rest, cube_size)
+    placements = {
+        frozenset(zip(x, y, z))
+        for x, y, z in zip(xs.tolist(), ys.tolist(), zs.tolist())
+    }
+    logger.debug(f"generated {len(placements)} unique placements")
     return placements
+
+
+def generate_placement_matrix(
+    voxels: frozenset[VoxelType], cube_size: int
+) -> np.ndarray:
+    """
+    Return all unique placements of a blokk within the cube as a sorted
+    (n_placements, volume) matrix of cell indices, where the cell (x, y, z) is
+    x*n*n + y*n + z. Each row is sorted.
+
+    All 24 rotations are applied with one matmul and all translations by
+    broadcasting, so no python loop runs per rotation or translation.
+    """
+    voxels_array = np.array(sorted(voxels), dtype=np.int64)
+    volume = len(voxels_array)
+
+    # (24, volume, 3): every rotation, normalized so each axis starts at zero
+    rotated = _rotation_tensor() @ voxels_array.T
+    rotated = rotated.transpose(0, 2, 1)
+    rotated -= rotated.min(axis=1, keepdims=True)
+    free_space = cube_size - 1 - rotated.max(axis=1)
+
+    # every offset in the cube, and which rotations it keeps inside the cube
+    offsets = np.indices((cube_size,) * 3).reshape(3, -1).T
+    fits = np.all(offsets[None, :, :] <= free_space[:, None, :], axis=-1)
+
+    # (n_fitting, volume, 3) placements, packed into cell indices
+    placed = rotated[:, None, :, :] + offsets[None, :, None, :]
+    placed = placed[fits]
+    cells = (placed[..., 0] * cube_size + placed[..., 1]) * cube_size + placed[..., 2]
+    cells.sort(axis=1)
+    if len(cells) == 0:
+        return cells.reshape(0, volume)
+
+    # pack each row into one integer, most significant cell first, so that np.unique
+    # on the packed keys both deduplicates and sorts the rows
+    n_cells = cube_size**3
+    if n_cells**volume >= 2**63:
+        return np.unique(cells, axis=0)
+    keys = cells @ (n_cells ** np.arange(volume - 1, -1, -1, dtype=np.int64))
+    _, first_rows = np.unique(keys, return_index=True)
+    return cells[first_rows]
+
+
+@cache
+def _rotation_tensor() -> np.ndarray:
+    return np.stack(all_rotation_matrices())
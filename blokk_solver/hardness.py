@@ -0,0 +1,60 @@
+import logging
+import math
+from collections import Counter
+from functools import lru_cache
+from typing import Iterable
+
+from blokk_solver.blokks import get_blokk, get_blokks, get_id_to_shape_class
+from blokk_solver.placement_cache import get_placement_cells
+
+logger = logging.getLogger(__name__)
+
+# A linear model of log2(seconds) the default search takes to solve a sample, fitted
+# by least squares to all 1,381 multisets of shapes of the 3x3x3 cube with
+# benchmarks/fit_hardness.py, which also refits it for other cubes. It only ranks
+# samples roughly (Spearman correlation 0.42 with the measured times), which is
+# enough to order a sweep.
+HARDNESS_WEIGHTS = {
+    # more blokks make for a deeper search
+    "n_blokks": 1.0,
+    # for as many blokks, big ones leave less room to go wrong
+    "n_volume_5": -0.45,
+    # log2 of the product of the blokks' placement counts
+    "log2_placements": -0.09,
+    # log2 of the ways to permute blokks of the same shape, which the search skips
+    "log2_interchangeable": -0.32,
+}
+HARDNESS_INTERCEPT = -9.5
+
+
+def sample_features(blokk_ids: Iterable[int], cube_size: int) -> dict[str, float]:
+    """
+    The cheap features of a blokk sample that hardness_score weighs.
+    """
+    blokks = get_blokks(blokk_ids)
+    shape_class_counts = Counter(get_id_to_shape_class()[b.id] for b in blokks)
+    return {
+        "n_blokks": len(blokks),
+        "n_volume_5": sum(b.volume == 5 for b in blokks),
+        "log2_placements": sum(log2_placements(b.id, cube_size) for b in blokks),
+        "log2_interchangeable": sum(
+            math.log2(math.factorial(n)) for n in shape_class_counts.values()
+        ),
+    }
+
+
+def hardness_score(blokk_ids: Iterable[int], cube_size: int) -> float:
+    """
+    Estimate how hard a blokk sample is to solve, as log2 of the expected seconds.
+    """
+    features = sample_features(blokk_ids, cube_size)
+    return HARDNESS_INTERCEPT + sum(
+        weight * features[name] for name, weight in HARDNESS_WEIGHTS.items()
+    )
+
+
+@lru_cache(maxsize=1024)
+def log2_placements(blokk_id: int, cube_size: int) -> float:
+    blokk = get_blokk(blokk_id)
+    n_placements = len(get_placement_cells(blokk.voxels, cube_size=cube_size))
+    return math.log2(n_placements) if n_placements else -math.inf
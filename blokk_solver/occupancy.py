@@ -0,0 +1,184 @@
+import logging
+from collections import OrderedDict
+from typing import Generator, Optional
+
+from blokk_solver.feasibility import regions_fillable
+from blokk_solver.stats import SolveStats
+
+logger = logging.getLogger(__name__)
+
+# Dead ends remembered by default, each a few hundred bytes
+DEFAULT_DEAD_END_CACHE_SIZE = 1 << 18
+# Only states with at least this many blokks left are looked up and remembered. With
+# fewer, searching again is about as fast as a lookup, and there are many more of them.
+MIN_BLOKKS_TO_MEMO = 4
+
+
+class DeadEndCache:
+    """
+    A bounded memo of the search states that are proven to have no packing, shared
+    by every search that is passed the same cache, so that samples with blokks in
+    common do not explore the same dead ends again.
+
+    A state is the occupied cells and the multiset of blokks left to place. Blokks
+    are identified by their placements rather than their ids, so that blokks of one
+    shape share their dead ends across samples, while a blokk whose placements were
+    restricted by symmetry breaking is never confused with an unrestricted one. The
+    multiset is packed into one int, 8 bits per distinct set of placements, so a
+    state is a pair of ints. The least recently used states are evicted first.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_DEAD_END_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._dead_ends: OrderedDict[tuple[int, int], None] = OrderedDict()
+        self._shifts: dict[tuple[int, tuple[int, ...]], int] = {}
+
+    def shift(self, masks: tuple[int, ...], cube_size: int) -> int:
+        # the bit offset of the count of blokks with these placements
+        return 8 * self._shifts.setdefault((cube_size, masks), len(self._shifts))
+
+    def __contains__(self, state: tuple[int, int]) -> bool:
+        if state in self._dead_ends:
+            self._dead_ends.move_to_end(state)
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def add(self, state: tuple[int, int]):
+        self._dead_ends[state] = None
+        if len(self._dead_ends) > self.maxsize:
+            self._dead_ends.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._dead_ends)
+
+    def clear(self):
+        self._dead_ends.clear()
+        self._shifts.clear()
+        self.hits = self.misses = 0
+
+
+def group_interchangeable(
+    id_to_masks: dict[int, tuple[int, ...]],
+) -> list[tuple[list[int], tuple[int, ...]]]:
+    """
+    Group blokk ids that have exactly the same placements, e.g. two straight
+    triominoes. Blokks in a group are interchangeable, so the search only decides
+    where the group's placements go and hands them out to the ids in order.
+    """
+    masks_to_ids: dict[tuple[int, ...], list[int]] = {}
+    for blokk_id, masks in id_to_masks.items():
+        masks_to_ids.setdefault(masks, []).append(blokk_id)
+    return [(sorted(ids), masks) for masks, ids in masks_to_ids.items()]
+
+
+def build_cell_index(
+    groups: list[tuple[list[int], tuple[int, ...]]], cube_size: int
+) -> list[list[tuple[int, int]]]:
+    """
+    For each cell, the (group, placement bitmask) pairs whose lowest cell it is.
+    """
+    cell_index: list[list[tuple[int, int]]] = [[] for _ in range(cube_size**3)]
+    for group_idx, (_, masks) in enumerate(groups):
+        for mask in masks:
+            lowest_cell = (mask & -mask).bit_length() - 1
+            cell_index[lowest_cell].append((group_idx, mask))
+    return cell_index
+
+
+def iter_packings(
+    id_to_masks: dict[int, tuple[int, ...]],
+    cube_size: int,
+    prune_regions: bool = False,
+    dead_ends: Optional[DeadEndCache] = None,
+    stats: Optional[SolveStats] = None,
+) -> Generator[tuple[int, ...]]:
+    """
+    Yield every way to fill the cube with the blokks, as a tuple of placement bitmasks
+    in the order of id_to_masks.
+
+    Depth first search over one occupancy bitmask that is updated as blokks are
+    placed and removed. Every cell must be filled, so the lowest empty cell is
+    filled next, and only placements whose lowest cell it is need to be tried.
+    Interchangeable blokks get their placements in id order, so each packing is
+    found once.
+
+    With prune_regions, the search backtracks as soon as the empty cells split into a
+    region that no subset of the remaining blokks can fill. The flood fill costs more
+    than it saves on a 3x3x3 cube, where dead ends are found within a few cells
+    anyway, so it is off by default.
+
+    With dead_ends, states that were searched to the end without a packing are
+    remembered in the cache and skipped when reached again, by this or any later
+    search. A search that is stopped early remembers nothing of the states it was
+    still in.
+
+    With stats, the nodes, backtracks, placements considered and prunes of the
+    search are added to it.
+    """
+    groups = group_interchangeable(id_to_masks)
+    cell_index = build_cell_index(groups, cube_size)
+    remaining = [len(ids) for ids, _ in groups]
+    placed: list[list[int]] = [[] for _ in groups]
+    volumes = [masks[0].bit_count() if masks else 0 for _, masks in groups]
+    full = (1 << cube_size**3) - 1
+    n_blokks = len(id_to_masks)
+    # each group's unit in the packed multiset of blokks left, see DeadEndCache
+    units = [0] * len(groups)
+    if dead_ends is not None:
+        units = [1 << dead_ends.shift(masks, cube_size) for _, masks in groups]
+
+    n_found = 0
+
+    def _search(occupied: int, n_placed: int, left: int):
+        nonlocal n_found
+        if stats is not None:
+            stats.nodes += 1
+        if occupied == full:
+            if n_placed == n_blokks:
+                n_found += 1
+                yield
+            return
+        memo = dead_ends is not None and n_blokks - n_placed >= MIN_BLOKKS_TO_MEMO
+        if memo and (occupied, left) in dead_ends:
+            if stats is not None:
+                stats.prunes["dead_end"] += 1
+            return
+        if prune_regions and not regions_fillable(
+            occupied,
+            (v for v, n in zip(volumes, remaining) for _ in range(n)),
+            cube_size,
+        ):
+            if stats is not None:
+                stats.prunes["regions"] += 1
+            return
+        n_found_before = n_found
+        # the lowest zero bit of occupied
+        cell = (~occupied & (occupied + 1)).bit_length() - 1
+        candidates = cell_index[cell]
+        if stats is not None:
+            stats.placements_considered += len(candidates)
+        for group_idx, mask in candidates:
+            if remaining[group_idx] and not mask & occupied:
+                remaining[group_idx] -= 1
+                placed[group_idx].append(mask)
+                yield from _search(
+                    occupied | mask, n_placed + 1, left - units[group_idx]
+                )
+                placed[group_idx].pop()
+                remaining[group_idx] += 1
+        if n_found == n_found_before:
+            if stats is not None:
+                stats.backtracks += 1
+            if memo:
+                dead_ends.add((occupied, left))
+
+    left = sum(unit * n for unit, n in zip(units, remaining))
+    for _ in _search(0, 0, left):
+        id_to_mask = {}
+        for (ids, _), masks in zip(groups, placed):
+            id_to_mask.update(zip(ids, sorted(masks)))
+        yield tuple(id_to_mask[blokk_id] for blokk_id in id_to_masks)
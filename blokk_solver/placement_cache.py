@@ -0,0 +1,101 @@
+import hashlib
+import logging
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from blokk_solver.bitboard import bitboard_to_bitmask, cells_to_bitboards
+from blokk_solver.geometry import VoxelType, canonical_shape, generate_placement_matrix
+
+logger = logging.getLogger(__name__)
+
+# Placements are stored as .npy files, one per (canonical shape, cube_size), holding
+# a (n_placements, volume) matrix of cell indices that can be memory-mapped on load,
+# under BLOKK_PLACEMENT_CACHE or else DEFAULT_CACHE_DIR. The environment variable is
+# read on every lookup, not at import, so that it can be set after importing.
+DEFAULT_CACHE_DIR = Path(".placement_cache")
+LRU_SIZE = 1024
+
+
+def shape_key(voxels: frozenset[VoxelType]) -> str:
+    """
+    A short, stable key for a blokk shape that is the same for all of its rotations.
+    """
+    shape = canonical_shape(voxels)
+    return hashlib.sha1(repr(shape).encode()).hexdigest()[:16]
+
+
+def placement_path(
+    voxels: frozenset[VoxelType], cube_size: int, cache_dir: Optional[Path] = None
+) -> Path:
+    if cache_dir is None:
+        cache_dir = os.environ.get("BLOKK_PLACEMENT_CACHE", DEFAULT_CACHE_DIR)
+    return Path(cache_dir) / f"cube_{cube_size}" / f"{shape_key(voxels)}.npy"
+
+
+def compute_placement_cells(voxels: frozenset[VoxelType], cube_size: int) -> np.ndarray:
+    """
+    All placements of a blokk in the cube as a sorted (n_placements, volume) matrix of
+    cell indices.
+    """
+    cells = generate_placement_matrix(voxels, cube_size=cube_size)
+    return cells.astype(_cell_dtype(cube_size))
+
+
+@lru_cache(maxsize=LRU_SIZE)
+def get_placement_cells(
+    voxels: frozenset[VoxelType], cube_size: int, cache_dir: Optional[Path] = None
+) -> np.ndarray:
+    """
+    Load the placement cell matrix of a blokk from the on-disk cache, computing and
+    saving it first if it is missing. The result is memory-mapped and read-only.
+    """
+    path = placement_path(voxels, cube_size=cube_size, cache_dir=cache_dir)
+    if not path.exists():
+        cells = compute_placement_cells(voxels, cube_size=cube_size)
+        _save_atomic(path, cells)
+    return np.load(path, mmap_mode="r")
+
+
+@lru_cache(maxsize=LRU_SIZE)
+def get_placement_masks(
+    voxels: frozenset[VoxelType], cube_size: int, cache_dir: Optional[Path] = None
+) -> tuple[int, ...]:
+    """
+    The placements of a blokk as python integer bitmasks, in cell matrix order.
+    """
+    cells = get_placement_cells(voxels, cube_size=cube_size, cache_dir=cache_dir)
+    return tuple(
+        bitboard_to_bitmask(bitboard)
+        for bitboard in cells_to_bitboards(cells, cube_size)
+    )
+
+
+def save_all_placements(cube_size: int, cache_dir: Optional[Path] = None) -> None:
+    """
+    Fill the on-disk cache with the placements of every blokk for cube_size.
+    """
+    from blokk_solver.blokks import get_blokks
+
+    for blokk in get_blokks():
+        cells = get_placement_cells(
+            blokk.voxels, cube_size=cube_size, cache_dir=cache_dir
+        )
+        logger.info(f"blokk {blokk.id}: {len(cells)} placements in cube_{cube_size}")
+
+
+def _cell_dtype(cube_size: int) -> type[np.unsignedinteger]:
+    return np.uint8 if cube_size**3 <= 256 else np.uint16
+
+
+def _save_atomic(path: Path, cells: np.ndarray) -> None:
+    # write to a temporary file first, so that concurrent workers never read a
+    # half-written cache entry
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, cells)
+    os.replace(tmp_path, path)
@@ -1,69 +1,435 @@
 import json
 import logging
-from itertools import product
-from typing import Optional
+import time
+from functools import lru_cache, partial
+from itertools import islice, product
+from pathlib import Path
+from typing import Generator, Optional
 
-from blokk_solver.blokks import get_blokks
+from blokk_solver.bitboard import bitmask_to_placement, cell_rotations, rotate_bitmask
+from blokk_solver.blokks import BlokkSet, get_blokks, get_id_to_shape_class
 from blokk_solver.combinatorics import BlokkCombinatorics
-from blokk_solver.geometry import VoxelType, generate_all_placements
+from blokk_solver.exact_cover import algorithm_x, build_columns
+from blokk_solver.feasibility import is_feasible
+from blokk_solver.geometry import VoxelType
+from blokk_solver.occupancy import DeadEndCache, iter_packings
+from blokk_solver.placement_cache import get_placement_masks
+from blokk_solver.stats import SolveStats
+from blokk_solver.vectorized import iter_builds_vectorized
 
 logger = logging.getLogger(__name__)
 
+# the dead ends found by "occupancy_memo", shared by every solve in this process
+DEAD_ENDS = DeadEndCache()
 
-def solve_all_now(cube_size, max_blokk_volume=5):
+
+def solve_all_now(
+    cube_size,
+    max_blokk_volume=5,
+    method="occupancy",
+    deduplicate_shapes=True,
+    count_all_solutions=False,
+    collect_stats=False,
+):
+    """
+    Solve every blokk sample of the cube.
+
+    With deduplicate_shapes, samples made of the same shapes up to rotation are
+    solved once, and the result is shared by all of them. With count_all_solutions,
+    every build of each sample is counted too, as "n_solutions". With collect_stats,
+    the SolveStats of finding the first build are added as "stats", a dict, and
+    "cached" tells whether the result was shared from another sample. Shared results
+    have no stats, so summing them counts every search once.
+    """
     combinatorics = BlokkCombinatorics(
         max_blokk_volume=max_blokk_volume, cube_size=cube_size
     )
     solutions = []
+    if deduplicate_shapes:
+        for (
+            integer_partition_number,
+            key,
+        ) in combinatorics.generate_shape_class_samples():
+            blokk_samples = list(combinatorics.expand_shape_class_sample(key))
+            result = _solve_sample(
+                blokk_samples[0], cube_size, method, count_all_solutions, collect_stats
+            )
+            for i, blokk_ids in enumerate(blokk_samples):
+                shared = {**result, "ids": blokk_ids}
+                if collect_stats:
+                    shared["cached"] = i > 0
+                    shared["stats"] = None if i > 0 else result["stats"]
+                solutions.append([shared])
+        return solutions
+
     for (
         integer_partition_number,
         blokk_ids,
     ) in combinatorics.generate_all_blokk_samples():
-        first_winning_build = solve(blokk_ids=set(blokk_ids)) or []
-        solutions.append(
-            [{"ids": blokk_ids, "first_winning_build": first_winning_build}]
+        result = _solve_sample(
+            blokk_ids, cube_size, method, count_all_solutions, collect_stats
         )
+        solutions.append([result])
     return solutions
 
 
-def solve(blokk_ids: set[int]) -> Optional[set[frozenset[VoxelType]]]:
-    # a list of blokks
-    blokks = get_blokks(blokk_ids)
+def _solve_sample(
+    blokk_ids, cube_size, method, count_all_solutions, collect_stats=False
+) -> dict:
+    stats = SolveStats() if collect_stats else None
+    result = {
+        "ids": blokk_ids,
+        "first_winning_build": (
+            solve(blokk_ids=blokk_ids, cube_size=cube_size, method=method, stats=stats)
+            or []
+        ),
+    }
+    if collect_stats:
+        result["cached"] = False
+        result["stats"] = stats.as_dict()
+    if count_all_solutions:
+        result["n_solutions"] = count_solutions(
+            blokk_ids, cube_size=cube_size, method=method
+        )
+    return result
+
+
+def solve(
+    blokk_ids: BlokkSet | set[int],
+    cube_size: int = 3,
+    method: str = "occupancy",
+    break_symmetry: bool = True,
+    stats: Optional[SolveStats] = None,
+) -> Optional[set[frozenset[VoxelType]]]:
+    """
+    Return the first build of the blokks that fills the cube without overlaps, or None.
+    Blokks that fail the volume, fit or parity checks of is_feasible are rejected
+    before any search.
+
+    method selects the search engine:
+        "occupancy": depth first search that fills the lowest empty cell (default)
+        "occupancy_pruned": the same, backtracking as soon as an empty region
+            becomes unfillable, which pays off when dead ends are deep
+        "occupancy_memo": the same, skipping the states that an earlier solve in
+            this process already found to be dead ends, see DEAD_ENDS
+        "exact_cover": Algorithm X over cells and blokk ids, with pruning
+        "product": test every build in the cartesian product of placements
+        "vectorized": the same brute force, testing chunks of builds with NumPy
+
+    With break_symmetry, one blokk is only tried in one placement per orbit of the
+    cube's 24 rotations, since every build can be rotated into one of those.
+
+    With stats, the counters and timings of the solve are added to it, see
+    SolveStats.
+    """
+    build = solve_bitmasks(
+        blokk_ids,
+        cube_size=cube_size,
+        method=method,
+        break_symmetry=break_symmetry,
+        stats=stats,
+    )
+    if build is None:
+        return None
+    return {bitmask_to_placement(mask, cube_size) for mask in build.values()}
+
+
+def solve_bitmasks(
+    blokk_ids: BlokkSet | set[int],
+    cube_size: int = 3,
+    method: str = "occupancy",
+    break_symmetry: bool = True,
+    stats: Optional[SolveStats] = None,
+) -> Optional[dict[int, int]]:
+    """
+    Like solve, but return the build as a {blokk id: placement bitmask} dict, which
+    keeps track of which blokk goes where.
+    """
+    start = time.perf_counter()
+    id_to_masks = _get_id_to_masks(blokk_ids, cube_size, method)
+    feasible = is_feasible(id_to_masks, cube_size)
+    if feasible and break_symmetry:
+        id_to_masks, _ = _break_symmetry(id_to_masks, cube_size)
+    search_start = time.perf_counter()
+    build = None
+    if feasible:
+        build = next(_iter_builds(id_to_masks, cube_size, method, stats), None)
+
+    if stats is not None:
+        stats.load_seconds += search_start - start
+        stats.search_seconds += time.perf_counter() - search_start
+        if not feasible:
+            stats.prunes["feasibility"] += 1
+        stats.record_max_rss()
+    if build is None:
+        return None
+    return dict(zip(id_to_masks, build))
+
+
+def solve_iter(
+    blokk_ids: BlokkSet | set[int],
+    cube_size: int = 3,
+    method: str = "occupancy",
+    up_to_symmetry: bool = False,
+    limit: Optional[int] = None,
+) -> Generator[set[frozenset[VoxelType]]]:
+    """
+    Yield every build of the blokks that fills the cube, each exactly once, stopping
+    after limit builds. Builds are found one at a time, so memory does not grow with
+    the number of solutions.
+
+    With up_to_symmetry, only one build of each orbit under the 24 rotations of the
+    cube is yielded.
+    """
+    for solution in islice(
+        _iter_solutions(blokk_ids, cube_size, method, up_to_symmetry), limit
+    ):
+        yield {bitmask_to_placement(mask, cube_size) for mask in solution.values()}
+
+
+def count_solutions(
+    blokk_ids: BlokkSet | set[int],
+    cube_size: int = 3,
+    method: str = "occupancy",
+    up_to_symmetry: bool = False,
+    limit: Optional[int] = None,
+) -> int:
+    """
+    Count the builds solve_iter yields, without decoding them.
+    """
+    solutions = _iter_solutions(blokk_ids, cube_size, method, up_to_symmetry)
+    return sum(1 for _ in islice(solutions, limit))
+
 
-    # a list where each element is all possible placements of a blokk
-    all_blokk_placements = [generate_all_placements(blokk.voxels) for blokk in blokks]
+def save_solutions(
+    blokk_ids: BlokkSet | set[int],
+    path: str | Path,
+    cube_size: int = 3,
+    method: str = "occupancy",
+    up_to_symmetry: bool = False,
+    limit: Optional[int] = None,
+) -> int:
+    """
+    Write the builds solve_iter yields to path as they are found, one JSON line of
+    [blokk id, placement bitmask] pairs per build, and return how many were written.
+    """
+    n_solutions = 0
+    with open(path, "w") as f:
+        for solution in islice(
+            _iter_solutions(blokk_ids, cube_size, method, up_to_symmetry), limit
+        ):
+            f.write(json.dumps(sorted(solution.items())) + "\n")
+            n_solutions += 1
+    logger.info(f"Wrote {n_solutions} solutions of {sorted(blokk_ids)} to {path}")
+    return n_solutions
 
-    # take the cartesian produce of all those lists
-    all_build_attempts = product(*all_blokk_placements)
+
+def solve_all_builds(
+    blokk_ids: BlokkSet | set[int],
+    cube_size: int = 3,
+    method: str = "occupancy",
+    expand_symmetries: bool = False,
+) -> list[set[frozenset[VoxelType]]]:
+    """
+    Return every build of the blokks that fills the cube, one per orbit under the
+    rotations of the cube. With expand_symmetries, every rotation of those builds is
+    returned too, which is all the builds there are.
+    """
+    return list(
+        solve_iter(
+            blokk_ids,
+            cube_size=cube_size,
+            method=method,
+            up_to_symmetry=not expand_symmetries,
+        )
+    )
+
+
+def _iter_solutions(
+    blokk_ids: BlokkSet | set[int], cube_size: int, method: str, up_to_symmetry: bool
+) -> Generator[dict[int, int]]:
+    """
+    Yield every distinct build as a {blokk id: placement bitmask} dict.
+
+    The search breaks symmetry, and blokks of the same shape can swap places, so it
+    finds the same build several times. Rather than remembering the builds already
+    yielded, a build is only yielded when it is the canonical one: blokks of one shape
+    take their placements in id order, and it is the smallest build in its orbit that
+    the search can reach. Memory stays bounded however many solutions there are.
+    """
+    id_to_masks = _get_id_to_masks(blokk_ids, cube_size, method)
+    if not is_feasible(id_to_masks, cube_size):
+        return
+    id_to_masks, pinned_id = _break_symmetry(id_to_masks, cube_size)
+    if pinned_id is None:
+        return
+    pinned_masks = frozenset(id_to_masks[pinned_id])
+    rotations = cell_rotations(cube_size)
+
+    id_to_shape_class = get_id_to_shape_class()
+    shape_class_to_ids: dict[int, list[int]] = {}
+    for blokk_id in sorted(id_to_masks):
+        shape_class_to_ids.setdefault(id_to_shape_class[blokk_id], []).append(blokk_id)
+
+    def _canonical(solution: dict[int, int]) -> Optional[dict[int, int]]:
+        # the assignment of placements to blokk ids the search accepts, or None if it
+        # cannot reach this build
+        canonical = {}
+        for ids in shape_class_to_ids.values():
+            masks = sorted(solution[i] for i in ids)
+            if pinned_id in ids:
+                pinned_mask = next((m for m in masks if m in pinned_masks), None)
+                if pinned_mask is None:
+                    return None
+                masks.remove(pinned_mask)
+                canonical[pinned_id] = pinned_mask
+                ids = [i for i in ids if i != pinned_id]
+            canonical.update(zip(ids, masks))
+        return canonical
+
+    ids = list(id_to_masks)
+    for build in _SOLVERS[method](id_to_masks, cube_size):
+        solution = dict(zip(ids, build))
+        if solution != _canonical(solution):
+            continue
+
+        orbit = {}
+        for rotation in rotations:
+            rotated = {i: rotate_bitmask(m, rotation) for i, m in solution.items()}
+            orbit.setdefault(tuple(sorted(rotated.values())), rotated)
+        smallest_reachable = min(
+            key for key, rotated in orbit.items() if _canonical(rotated) is not None
+        )
+        if tuple(sorted(build)) != smallest_reachable:
+            continue
+
+        if up_to_symmetry:
+            yield solution
+        else:
+            yield from orbit.values()
+
+
+def _get_id_to_masks(
+    blokk_ids: BlokkSet | set[int], cube_size: int, method: str
+) -> dict[int, tuple[int, ...]]:
+    if method not in _SOLVERS:
+        raise ValueError(
+            f"Unknown solve method {method!r}, expected one of {list(_SOLVERS)}"
+        )
+
+    # a dict where each value is all possible placements of a blokk, as bitmasks
+    return {
+        blokk.id: get_placement_masks(blokk.voxels, cube_size=cube_size)
+        for blokk in get_blokks(blokk_ids)
+    }
+
+
+def _break_symmetry(
+    id_to_masks: dict[int, tuple[int, ...]], cube_size: int
+) -> tuple[dict[int, tuple[int, ...]], Optional[int]]:
+    """
+    Restrict one blokk to a single placement per orbit of the rotation group, which
+    leaves at least one build of every orbit of solutions. The blokk is chosen to
+    cut its placements the most, up to 24x for a blokk with no symmetry.
+
+    Returns the restricted placements and the id of the pinned blokk.
+    """
+    id_to_representatives = {
+        blokk_id: _orbit_representatives(masks, cube_size)
+        for blokk_id, masks in id_to_masks.items()
+        if masks
+    }
+    if not id_to_representatives:
+        return id_to_masks, None
+    pinned_id = min(
+        id_to_representatives,
+        key=lambda i: len(id_to_representatives[i]) / len(id_to_masks[i]),
+    )
+    return {**id_to_masks, pinned_id: id_to_representatives[pinned_id]}, pinned_id
+
+
+@lru_cache(maxsize=1024)
+def _orbit_representatives(masks: tuple[int, ...], cube_size: int) -> tuple[int, ...]:
+    # placements of a blokk are closed under rotation, so the smallest mask in an
+    # orbit is a placement too
+    rotations = cell_rotations(cube_size)
+    return tuple(sorted({min(rotate_bitmask(m, r) for r in rotations) for m in masks}))
+
+
+def _iter_product(
+    id_to_masks: dict[int, tuple[int, ...]], cube_size: int
+) -> Generator[tuple[int, ...]]:
+    # take the cartesian produce of all placements
+    all_build_attempts = product(*id_to_masks.values())
 
     # and then test all of those possibilities
     for build in all_build_attempts:
-        build_success = _test_build(set(build))
+        build_success = _test_build(build)
         if build_success:
-            return set(build)
-    return None
-
-
-def _test_build(build: set[frozenset[VoxelType]]) -> bool:
-    seen_voxels: set[VoxelType] = set()
-    for blokk in build:
-        for voxel in blokk:
-            if voxel in seen_voxels:
-                return False
-            else:
-                seen_voxels.add(voxel)
+            yield build
+
+
+def _iter_exact_cover(
+    id_to_masks: dict[int, tuple[int, ...]], cube_size: int
+) -> Generator[tuple[int, ...]]:
+    # each placement is a row covering its cells and the column of its blokk id,
+    # so a cover uses every cell once and every blokk once.
+    rows: dict[tuple[int, int], list] = {}
+    for blokk_id, masks in id_to_masks.items():
+        for mask in masks:
+            cells = [cell for cell in range(cube_size**3) if mask >> cell & 1]
+            rows[(blokk_id, mask)] = [("blokk", blokk_id), *cells]
+    columns = build_columns(rows)
+    # a cell that no placement can reach makes the cube unsolvable
+    if len(columns) < cube_size**3 + len(id_to_masks):
+        return
+
+    for cover in algorithm_x(columns, rows):
+        id_to_mask = dict(cover)
+        yield tuple(id_to_mask[blokk_id] for blokk_id in id_to_masks)
+
+
+def _test_build(build: tuple[int, ...]) -> bool:
+    seen_cells = 0
+    for mask in build:
+        if seen_cells & mask:
+            return False
+        seen_cells |= mask
     return True
 
 
-def hash_partition(n: int, partition: frozenset) -> str:
+def _iter_builds(
+    id_to_masks: dict[int, tuple[int, ...]],
+    cube_size: int,
+    method: str,
+    stats: Optional[SolveStats] = None,
+) -> Generator[tuple[int, ...]]:
+    if stats is not None and method in _COUNTING_SOLVERS:
+        return _SOLVERS[method](id_to_masks, cube_size, stats=stats)
+    return _SOLVERS[method](id_to_masks, cube_size)
+
+
+_SOLVERS = {
+    "exact_cover": _iter_exact_cover,
+    "occupancy": iter_packings,
+    "occupancy_pruned": partial(iter_packings, prune_regions=True),
+    "occupancy_memo": partial(iter_packings, dead_ends=DEAD_ENDS),
+    "product": _iter_product,
+    "vectorized": iter_builds_vectorized,
+}
+# the methods that count nodes, backtracks and placements into a SolveStats
+_COUNTING_SOLVERS = {"occupancy", "occupancy_pruned", "occupancy_memo"}
+
+
+def hash_partition(n: int, partition: BlokkSet | set[int]) -> str:
     return json.dumps({"n": n, "ids": sorted(partition)})
 
 
-def unhash_partition(s: str) -> tuple[int, frozenset]:
+def unhash_partition(s: str) -> tuple[int, BlokkSet]:
     """
-    Parse a JSON string of the form '{"n": 27, "ids": [1,2,3]}' and return (n, frozenset of ids).
+    Parse a JSON string of the form '{"n": 27, "ids": [1,2,3]}' and return (n, BlokkSet of ids).
     """
     data = json.loads(s)
     n = data["n"]
-    ids = frozenset(data["ids"])
+    ids = BlokkSet.from_ids(data["ids"])
     return n, ids
@@ -0,0 +1,98 @@
+import logging
+import sys
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Iterable
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# why a search gave up on a subset or a state without exploring it:
+#   feasibility: the subset failed is_feasible, so it was never searched
+#   regions: an empty region could not be filled by the blokks left
+#   dead_end: the state was already known to be a dead end, see DeadEndCache
+PRUNE_REASONS = ("feasibility", "regions", "dead_end")
+
+
+@dataclass(slots=True)
+class SolveStats:
+    """
+    Counters and timings of one or more solves, filled in by passing a SolveStats to
+    solve or solve_bitmasks. Only the occupancy searches count nodes, backtracks and
+    placements; the other methods only report timings and feasibility prunes.
+
+    nodes: states of the search visited
+    backtracks: states searched to the end without finding a packing
+    placements_considered: placements looked at to fill the lowest empty cell
+    prunes: the number of states or subsets given up on, per PRUNE_REASONS
+    load_seconds: time spent loading placements, checking feasibility and breaking
+        symmetry
+    search_seconds: time spent searching
+    max_rss_bytes: the peak resident memory of the process so far, 0 if unknown
+    """
+
+    nodes: int = 0
+    backtracks: int = 0
+    placements_considered: int = 0
+    prunes: Counter = field(default_factory=Counter)
+    load_seconds: float = 0.0
+    search_seconds: float = 0.0
+    max_rss_bytes: int = 0
+
+    def record_max_rss(self):
+        if resource is not None:
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # ru_maxrss is in bytes on macOS, and in kilobytes elsewhere
+            if sys.platform != "darwin":
+                max_rss *= 1024
+            self.max_rss_bytes = max(self.max_rss_bytes, max_rss)
+
+    def __iadd__(self, other: "SolveStats") -> "SolveStats":
+        self.nodes += other.nodes
+        self.backtracks += other.backtracks
+        self.placements_considered += other.placements_considered
+        self.prunes.update(other.prunes)
+        self.load_seconds += other.load_seconds
+        self.search_seconds += other.search_seconds
+        self.max_rss_bytes = max(self.max_rss_bytes, other.max_rss_bytes)
+        return self
+
+    def as_dict(self) -> dict[str, int | float]:
+        """
+        The stats as a flat dict, with one prunes_<reason> entry per PRUNE_REASONS,
+        e.g. to store as a row or a STRUCT column.
+        """
+        return {
+            "nodes": self.nodes,
+            "backtracks": self.backtracks,
+            "placements_considered": self.placements_considered,
+            **{f"prunes_{reason}": self.prunes[reason] for reason in PRUNE_REASONS},
+            "load_seconds": self.load_seconds,
+            "search_seconds": self.search_seconds,
+            "max_rss_bytes": self.max_rss_bytes,
+        }
+
+    @classmethod
+    def from_dict(cls, stats: dict[str, int | float]) -> "SolveStats":
+        return cls(
+            nodes=stats["nodes"],
+            backtracks=stats["backtracks"],
+            placements_considered=stats["placements_considered"],
+            prunes=Counter(
+                {reason: stats[f"prunes_{reason}"] for reason in PRUNE_REASONS}
+            ),
+            load_seconds=stats["load_seconds"],
+            search_seconds=stats["search_seconds"],
+            max_rss_bytes=stats["max_rss_bytes"],
+        )
+
+
+def sum_stats(stats: Iterable[SolveStats]) -> SolveStats:
+    total = SolveStats()
+    for s in stats:
+        total += s
+    return total
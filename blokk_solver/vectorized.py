@@ -0,0 +1,60 @@
+import logging
+import math
+from typing import Generator
+
+import numpy as np
+
+from blokk_solver.bitboard import bitmasks_to_bitboards, n_words, overlaps
+
+logger = logging.getLogger(__name__)
+
+# Builds tested per call. Each chunk holds a few (chunk_size, n_words) uint64 arrays,
+# about 8MB each for cubes up to 4x4x4.
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+
+def iter_builds_vectorized(
+    id_to_masks: dict[int, tuple[int, ...]],
+    cube_size: int,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Generator[tuple[int, ...]]:
+    """
+    Yield every build in the cartesian product of placements with no overlaps, in the
+    same order as itertools.product, as a tuple of placement bitmasks in the order of
+    id_to_masks.
+
+    Brute force like the "product" method, but builds are numbered and tested a chunk
+    at a time with NumPy: each build index is split into one placement index per blokk,
+    and the placements are ANDed against the cells occupied so far and ORed in, one
+    blokk at a time.
+    """
+    all_masks = list(id_to_masks.values())
+    sizes = [len(masks) for masks in all_masks]
+    n_builds = math.prod(sizes)
+    if n_builds >= np.iinfo(np.int64).max:
+        raise ValueError(f"Too many builds to number: {n_builds}")
+    all_bitboards = [bitmasks_to_bitboards(masks, cube_size) for masks in all_masks]
+    logger.debug(f"Testing {n_builds} builds in chunks of {chunk_size}")
+
+    for start in range(0, n_builds, chunk_size):
+        build_idx = np.arange(start, min(start + chunk_size, n_builds), dtype=np.int64)
+        placement_idx = _unravel(build_idx, sizes)
+
+        occupied = np.zeros((len(build_idx), n_words(cube_size)), dtype=np.uint64)
+        fits = np.ones(len(build_idx), dtype=bool)
+        for blokk, bitboards in enumerate(all_bitboards):
+            placed = bitboards[placement_idx[blokk]]
+            fits &= ~overlaps(occupied, placed)
+            occupied |= placed
+
+        for build in placement_idx[:, fits].T.tolist():
+            yield tuple(masks[i] for masks, i in zip(all_masks, build))
+
+
+def _unravel(build_idx: np.ndarray, sizes: list[int]) -> np.ndarray:
+    # a (n_blokks, n_builds) array of placement indices, the last blokk varying fastest
+    # like itertools.product
+    placement_idx = np.empty((len(sizes), len(build_idx)), dtype=np.int64)
+    for blokk in reversed(range(len(sizes))):
+        build_idx, placement_idx[blokk] = np.divmod(build_idx, sizes[blokk])
+    return placement_idx
@@ -1,15 +1,31 @@
 import logging
-from itertools import batched
+import math
+import os
+import shutil
+from pathlib import Path
+from typing import Generator, Iterable
 
-import duckdb
-import polars as pl
-from tqdm import tqdm
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from joblib import Parallel, delayed
 
+from blokk_solver.blokks import get_blokks, get_id_to_shape_class
 from blokk_solver.combinatorics import BlokkCombinatorics
+from blokk_solver.hardness import HARDNESS_INTERCEPT, HARDNESS_WEIGHTS, log2_placements
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.DEBUG)
 
+# duckdb, polars and tqdm are only imported by the functions that use them, so that
+# the shard writers, which only need pyarrow, start quickly
+
+# Samples are streamed as Arrow record batches of BlokkSets, stored as UBIGINT, see
+# iterate_sample_record_batches
+SAMPLE_SCHEMA = pa.schema(
+    [("integer_partition_idx", pa.uint32()), ("blokk_set", pa.uint64())]
+)
+
 
 def stream_blokk_samples_to_duckdb(
     database="blokk.duckdb",
@@ -19,6 +35,9 @@ def stream_blokk_samples_to_duckdb(
     restart=True,
     loglevel="INFO",
 ):
+    import duckdb
+    from tqdm import tqdm
+
     logging.getLogger().setLevel(loglevel)
 
     if database_schema is None:
@@ -40,19 +59,16 @@ def stream_blokk_samples_to_duckdb(
     combinatorics = BlokkCombinatorics(
         max_blokk_volume=max_blokk_volume, cube_size=cube_size
     )
-    sample_generator = combinatorics.generate_all_blokk_samples()
 
     con = duckdb.connect(database=database, read_only=False)
 
+    start_integer_partition_idx, start_batch_idx = 0, 0
     if not restart:
-        raise (NotImplementedError("Restart comes later"))
         try:
-            result = con.sql(f"""
-                select max(integer_partition_idx) as continue from {table_name}
-            """).fetchone()
-            restart_point = result[0] if result is not None else 0
-            logger.info(f"restarting from {restart_point}")
-        except ValueError:
+            start_integer_partition_idx, start_batch_idx = _find_restart_point(
+                con, table_name
+            )
+        except duckdb.CatalogException:
             logger.warning("Could not access previously saved data, restarting.")
             restart = True
 
@@ -69,43 +85,392 @@ def stream_blokk_samples_to_duckdb(
             CREATE TABLE {table_name} (
                 sample_idx INT PRIMARY KEY DEFAULT nextval('{sequence_name}'),
                 integer_partition_idx INTEGER,
-                blokks INT8[],
+                blokk_set UBIGINT,
                 batch_idx INT
             )
         """)
 
+    sample_masks = combinatorics.generate_blokk_sample_masks(
+        start_integer_partition_idx=start_integer_partition_idx
+    )
+
     # Wrap batch enumeration with tqdm for progress tracking
     batch_size = 10000
+    n_samples = sum(
+        combinatorics.count_samples_per_integer_partition()[
+            start_integer_partition_idx:
+        ]
+    )
+    logger.info(f"Generating {n_samples} samples")
     logger.debug(f"Processing batches of {batch_size} rows")
-    for batch_idx, batch in enumerate(
-        tqdm(batched(sample_generator, batch_size), desc="\t⏩")
+    for batch_idx, record_batch in enumerate(
+        tqdm(
+            iterate_sample_record_batches(sample_masks, batch_size),
+            desc="\t⏩",
+            total=math.ceil(n_samples / batch_size),
+        ),
+        start=start_batch_idx,
     ):
-        # should really filter by blokk length < cube_length,
-        # though that becomes unimportant at higher dimensions.
-        integer_partition_idx, blokk_ids = zip(*batch)
-
-        df = pl.DataFrame(
-            {
-                "integer_partition_idx": pl.Series(
-                    integer_partition_idx, dtype=pl.UInt32
-                ),
-                "blokks": pl.Series(
-                    [list(map(int, x)) for x in blokk_ids], dtype=pl.List(pl.Int8)
-                ),
-            },
-        )
-        logger.debug(f"Prepared polars df {df}")
-
-        # Insert using DuckDB's numpy array support
+        con.register("record_batch", record_batch)
         con.sql(f"""
-            INSERT INTO {table_name} (integer_partition_idx, blokks, batch_idx)
-            SELECT *, '{batch_idx}' as batch_idx FROM df
+            INSERT INTO {table_name} (integer_partition_idx, blokk_set, batch_idx)
+            SELECT integer_partition_idx, blokk_set, {batch_idx} AS batch_idx
+            FROM record_batch
         """)
+        con.unregister("record_batch")
 
     # After all batches, check row count and print
     result = con.sql(f"SELECT COUNT(*) FROM {table_name}").fetchone()
     logger.info(f"Inserted {result[0]} rows into {table_name}")
 
 
+def stream_sharded_blokk_samples_to_duckdb(
+    database="blokk.duckdb",
+    cube_size=2,
+    max_blokk_volume=5,
+    database_schema=None,
+    num_shards=None,
+    n_jobs=-1,
+    shard_dir=None,
+    loglevel="INFO",
+):
+    """
+    Generate the samples table in parallel: the samples are split into num_shards
+    consecutive ranges of nearly equal size, which are written to Parquet by separate
+    processes and then merged into the same table stream_blokk_samples_to_duckdb
+    would have written.
+
+    Shards that were already written with the same num_shards are not generated
+    again, so an interrupted run can simply be started again.
+    """
+    logging.getLogger().setLevel(loglevel)
+
+    num_shards = num_shards or os.cpu_count()
+    if shard_dir is None:
+        shard_dir = f"samples_cube_{cube_size}_{max_blokk_volume}_shards"
+
+    logger.info(
+        "\n==== stream_sharded_blokk_samples_to_duckdb ======\n"
+        f"database        : {database}\n"
+        f"cube_size       : {cube_size}\n"
+        f"max_blokk_volume: {max_blokk_volume}\n"
+        f"num_shards      : {num_shards}\n"
+        f"shard_dir       : {shard_dir}\n"
+        "===================================================="
+    )
+
+    Parallel(n_jobs=n_jobs)(
+        delayed(write_sample_shard)(
+            shard=shard,
+            num_shards=num_shards,
+            cube_size=cube_size,
+            max_blokk_volume=max_blokk_volume,
+            shard_dir=shard_dir,
+        )
+        for shard in range(num_shards)
+    )
+    merge_sample_shards_to_duckdb(
+        database=database,
+        cube_size=cube_size,
+        max_blokk_volume=max_blokk_volume,
+        database_schema=database_schema,
+        shard_dir=shard_dir,
+        num_shards=num_shards,
+    )
+
+
+def write_sample_shard(
+    shard,
+    num_shards,
+    cube_size=2,
+    max_blokk_volume=5,
+    shard_dir="samples_shards",
+    batch_size=10000,
+) -> Path:
+    """
+    Write one shard of the samples to shard_dir/shard_<shard>_of_<num_shards>/, one
+    Parquet file per batch, with each sample's sample_idx numbered from 1 like the
+    samples table. The directory only appears once the shard is complete.
+    """
+    path = _shard_path(shard_dir, shard, num_shards)
+    if path.exists():
+        logger.info(f"Shard {shard} already written to {path}, skipping")
+        return path
+
+    combinatorics = BlokkCombinatorics(
+        max_blokk_volume=max_blokk_volume, cube_size=cube_size
+    )
+    sample_masks = combinatorics.generate_blokk_sample_masks(
+        shard=shard, num_shards=num_shards
+    )
+
+    start, stop = combinatorics.shard_sample_range(shard, num_shards)
+
+    tmp_path = path.with_suffix(".tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir(parents=True)
+    sample_idx = start + 1
+    for batch_idx, record_batch in enumerate(
+        iterate_sample_record_batches(sample_masks, batch_size)
+    ):
+        record_batch = record_batch.append_column(
+            "sample_idx",
+            pa.array(
+                np.arange(sample_idx, sample_idx + len(record_batch)),
+                type=pa.uint64(),
+            ),
+        )
+        pq.write_table(
+            pa.Table.from_batches([record_batch]),
+            tmp_path / f"batch_{batch_idx:06d}.parquet",
+        )
+        sample_idx += len(record_batch)
+    tmp_path.rename(path)
+    logger.info(f"Wrote {stop - start} samples to {path}")
+    return path
+
+
+def merge_sample_shards_to_duckdb(
+    database="blokk.duckdb",
+    cube_size=2,
+    max_blokk_volume=5,
+    database_schema=None,
+    shard_dir="samples_shards",
+    num_shards=None,
+    batch_size=10000,
+):
+    """
+    Merge the num_shards shards written by write_sample_shard into the samples
+    table. Rows are numbered and batched as in a sequential run. Shards of a run with another num_shards, and
+    shards that are still being written, are left out.
+    """
+    import duckdb
+
+    num_shards = num_shards or os.cpu_count()
+    missing = [
+        shard
+        for shard in range(num_shards)
+        if not _shard_path(shard_dir, shard, num_shards).exists()
+    ]
+    if missing:
+        raise FileNotFoundError(
+            f"Shards {missing} of {num_shards} are missing from {shard_dir}"
+        )
+
+    if database_schema is None:
+        database_schema = f"cube_{cube_size}"
+    table_name = f"{database_schema}.samples_{max_blokk_volume}"
+    sequence_name = f"{database_schema}.sq_samples_{max_blokk_volume}"
+
+    con = duckdb.connect(database=database, read_only=False)
+    con.sql(f"CREATE SCHEMA IF NOT EXISTS {database_schema}")
+    con.sql(f"DROP TABLE IF EXISTS {table_name}")
+    con.sql(f"DROP SEQUENCE IF EXISTS {sequence_name}")
+    con.sql(f"""
+        CREATE TABLE {table_name} AS
+        SELECT
+            sample_idx::INT AS sample_idx,
+            integer_partition_idx::INTEGER AS integer_partition_idx,
+            blokk_set::UBIGINT AS blokk_set,
+            ((sample_idx - 1) // {batch_size})::INT AS batch_idx
+        FROM read_parquet('{_shard_glob(shard_dir, num_shards)}')
+        ORDER BY sample_idx
+    """)
+    (n_samples,) = con.sql(f"SELECT COUNT(*) FROM {table_name}").fetchone()
+
+    # so that a resumed stream_blokk_samples_to_duckdb keeps numbering samples
+    con.sql(f"CREATE SEQUENCE {sequence_name} START {n_samples + 1}")
+    con.sql(f"""
+        ALTER TABLE {table_name} ADD PRIMARY KEY (sample_idx);
+        ALTER TABLE {table_name}
+            ALTER COLUMN sample_idx SET DEFAULT nextval('{sequence_name}');
+    """)
+    logger.info(f"Merged {n_samples} rows into {table_name}")
+
+
+def _shard_path(shard_dir, shard, num_shards) -> Path:
+    # num_shards is part of the name, since the same shard of another num_shards
+    # holds other samples
+    return Path(shard_dir) / f"shard_{shard:04d}_of_{num_shards:04d}"
+
+
+def _shard_glob(shard_dir, num_shards) -> str:
+    # only complete shards: not the shard_<shard>_of_<num_shards>.tmp directories
+    return str(
+        Path(shard_dir)
+        / f"shard_[0-9][0-9][0-9][0-9]_of_{num_shards:04d}"
+        / "*.parquet"
+    )
+
+
+def add_hardness_scores(con, table_name, cube_size):
+    """
+    Add a hardness column to the samples table with the hardness_score of every
+    sample that does not have one yet. The features are computed in DuckDB from a
+    small table of per-blokk features, so the samples never leave the database.
+    """
+    import polars as pl
+
+    id_to_shape_class = get_id_to_shape_class()
+    blokk_features = pl.DataFrame(
+        [
+            {
+                "blokk_id": blokk.id,
+                "shape_class": id_to_shape_class[blokk.id],
+                "volume": blokk.volume,
+                "log2_placements": log2_placements(blokk.id, cube_size),
+            }
+            for blokk in get_blokks()
+            if blokk.max_length <= cube_size
+        ]
+    )
+    score = " + ".join(
+        [str(HARDNESS_INTERCEPT)]
+        + [f"{weight} * {name}" for name, weight in HARDNESS_WEIGHTS.items()]
+    )
+
+    con.sql(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS hardness REAL")
+    con.sql(f"""
+        UPDATE {table_name} SET hardness = scores.hardness
+        FROM (
+            SELECT sample_idx, {score} AS hardness
+            FROM (
+                SELECT
+                    sample_idx,
+                    sum(n) AS n_blokks,
+                    sum(n_volume_5) AS n_volume_5,
+                    sum(log2_placements) AS log2_placements,
+                    sum(log2(factorial(n::INTEGER))) AS log2_interchangeable
+                FROM (
+                    SELECT
+                        sample_idx,
+                        shape_class,
+                        count(*) AS n,
+                        count(*) FILTER (volume = 5) AS n_volume_5,
+                        sum(log2_placements) AS log2_placements
+                    FROM (
+                        SELECT
+                            sample_idx,
+                            unnest({_blokk_set_to_ids_sql("blokk_set")}) AS blokk_id
+                        FROM {table_name} WHERE hardness IS NULL
+                    )
+                    JOIN blokk_features USING (blokk_id)
+                    GROUP BY sample_idx, shape_class
+                )
+                GROUP BY sample_idx
+            )
+        ) AS scores
+        WHERE {table_name}.sample_idx = scores.sample_idx
+    """)
+    logger.info(f"Scored the hardness of the samples in {table_name}")
+
+
+def write_blokk_samples_to_parquet(
+    path,
+    cube_size=2,
+    max_blokk_volume=5,
+    batch_size=1_000_000,
+    loglevel="INFO",
+) -> int:
+    """
+    Stream every sample to a single Parquet file, one row group per batch_size
+    samples, with columns sample_idx (numbered from 1 like the samples table),
+    integer_partition_idx and blokk_set, the blokks.BlokkSet of the sample as a
+    uint64. Returns the number of samples.
+    """
+    logging.getLogger().setLevel(loglevel)
+    combinatorics = BlokkCombinatorics(
+        max_blokk_volume=max_blokk_volume, cube_size=cube_size
+    )
+    n_samples = 0
+    schema = pa.schema([("sample_idx", pa.uint64()), *SAMPLE_SCHEMA])
+    with pq.ParquetWriter(path, schema) as writer:
+        for record_batch in iterate_sample_record_batches(
+            combinatorics.generate_blokk_sample_masks(), batch_size
+        ):
+            sample_idx = np.arange(n_samples + 1, n_samples + len(record_batch) + 1)
+            writer.write_batch(
+                pa.RecordBatch.from_arrays(
+                    [pa.array(sample_idx, type=pa.uint64()), *record_batch.columns],
+                    schema=schema,
+                )
+            )
+            n_samples += len(record_batch)
+    logger.info(f"Wrote {n_samples} samples to {path}")
+    return n_samples
+
+
+def iterate_sample_record_batches(
+    sample_masks: Iterable[tuple[int, np.ndarray]], batch_size=10000
+) -> Generator[pa.RecordBatch]:
+    """
+    Regroup the chunks of BlokkCombinatorics.generate_blokk_sample_masks into Arrow
+    record batches of SAMPLE_SCHEMA with batch_size rows each, except the last.
+    """
+    integer_partition_idx_parts, mask_parts, n_buffered = [], [], 0
+    for integer_partition_idx, masks in sample_masks:
+        integer_partition_idx_parts.append(
+            np.full(len(masks), integer_partition_idx, dtype=np.uint32)
+        )
+        mask_parts.append(masks)
+        n_buffered += len(masks)
+        if n_buffered < batch_size:
+            continue
+
+        integer_partition_idx = np.concatenate(integer_partition_idx_parts)
+        masks = np.concatenate(mask_parts)
+        n_full = n_buffered - n_buffered % batch_size
+        for start in range(0, n_full, batch_size):
+            yield _record_batch(
+                integer_partition_idx[start : start + batch_size],
+                masks[start : start + batch_size],
+            )
+        integer_partition_idx_parts = [integer_partition_idx[n_full:]]
+        mask_parts = [masks[n_full:]]
+        n_buffered -= n_full
+
+    if n_buffered:
+        yield _record_batch(
+            np.concatenate(integer_partition_idx_parts), np.concatenate(mask_parts)
+        )
+
+
+def _record_batch(integer_partition_idx, masks) -> pa.RecordBatch:
+    return pa.RecordBatch.from_arrays(
+        [pa.array(integer_partition_idx), pa.array(masks)], schema=SAMPLE_SCHEMA
+    )
+
+
+def _blokk_set_to_ids_sql(column) -> str:
+    # the blokk ids of a blokk_set column, as a list
+    return f"list_filter(range(1, 64), lambda i: ({column} >> i) & 1 = 1)"
+
+
+def _find_restart_point(con, table_name) -> tuple[int, int]:
+    """
+    Return the (integer_partition_idx, batch_idx) to resume an interrupted run from.
+
+    The last integer partition may only be partly written, so its rows are deleted
+    and it is sampled again. That makes resuming idempotent, however many times the
+    run was interrupted.
+    """
+    last_integer_partition_idx, last_batch_idx = con.sql(f"""
+        SELECT max(integer_partition_idx), max(batch_idx) FROM {table_name}
+    """).fetchone()
+    if last_integer_partition_idx is None:
+        logger.info("No previously saved samples, starting from the beginning")
+        return 0, 0
+
+    con.sql(f"""
+        DELETE FROM {table_name}
+        WHERE integer_partition_idx = {last_integer_partition_idx}
+    """)
+    logger.info(
+        f"Resuming from integer_partition_idx={last_integer_partition_idx}, "
+        f"batch_idx={last_batch_idx + 1}"
+    )
+    return last_integer_partition_idx, last_batch_idx + 1
+
+
 if __name__ == "__main__":
     stream_blokk_samples_to_duckdb(loglevel="DEBUG", restart=False)
@@ -1,36 +1,370 @@
 import logging
+import math
+import multiprocessing
+import os
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from functools import lru_cache
+from typing import Callable, Generator, Iterable, Optional
 
-import duckdb
+from blokk_solver.blokks import (
+    BlokkSet,
+    get_blokks,
+    get_id_to_shape_class,
+    shape_class_key,
+    shape_class_representative,
+)
+from blokk_solver.placement_cache import get_placement_masks
+from blokk_solver.solver import solve_bitmasks
+from blokk_solver.stats import SolveStats, sum_stats
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.DEBUG)
 
+# duckdb, polars and tqdm are only imported by the functions that use them, so that
+# worker processes, which only import this module for _solve_a_batch, start quickly
+
+# worker processes are not forked, since the parent holds an open, multi-threaded
+# DuckDB connection; forkserver is not available on Windows
+WORKER_START_METHOD = (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+# the orders samples can be solved in, by their hardness score: cheapest first for
+# quick coverage, hardest first so the slow samples do not all end up at the tail
+SAMPLE_ORDERS = {
+    "sample": "sample_idx",
+    "cheapest": "hardness, sample_idx",
+    "hardest": "hardness DESC, sample_idx",
+}
+
+# the stats column of the solutions table, a STRUCT with one field per
+# SolveStats.as_dict entry
+STATS_SQL_TYPE = "STRUCT({})".format(
+    ", ".join(
+        f"{name} {'BIGINT' if isinstance(value, int) else 'DOUBLE'}"
+        for name, value in SolveStats().as_dict().items()
+    )
+)
+
+
+def solve_samples_on_db(
+    database="blokk.duckdb",
+    cube_size=2,
+    max_blokk_volume=5,
+    database_schema=None,
+    batch_size=1000,
+    n_workers=None,
+    method="occupancy",
+    restart=False,
+    order="sample",
+    collect_stats=False,
+    loglevel="INFO",
+):
+    """
+    Solve every sample in the samples table with a pool of worker processes, and
+    append the results to the solutions table.
+
+    Results are appended a batch at a time, and samples that already have a result
+    are skipped, so an interrupted run can simply be started again. With restart,
+    the solutions table is recreated first.
+
+    order is one of SAMPLE_ORDERS. Ordering by hardness scores the samples first.
+
+    With collect_stats, the SolveStats of every solve are saved to the stats column
+    of the solutions table, and summed per batch in the debug log.
+    """
+    import duckdb
+    from tqdm import tqdm
+
+    from scripts.sample_to_db import add_hardness_scores
+
+    logging.getLogger().setLevel(loglevel)
+    if order not in SAMPLE_ORDERS:
+        raise ValueError(
+            f"Unknown sample order {order!r}, expected one of {list(SAMPLE_ORDERS)}"
+        )
+
+    if database_schema is None:
+        database_schema = f"cube_{cube_size}"
+    table_name = f"{database_schema}.samples_{max_blokk_volume}"
+    solutions_table_name = f"{database_schema}.solutions_{max_blokk_volume}"
+    n_workers = n_workers or os.cpu_count()
+
+    logger.info(
+        "\n==== solve_samples_on_db =========================\n"
+        f"database        : {database}\n"
+        f"cube_size       : {cube_size}\n"
+        f"table_name      : {table_name}\n"
+        f"solutions_table : {solutions_table_name}\n"
+        f"batch_size      : {batch_size}\n"
+        f"n_workers       : {n_workers}\n"
+        f"method          : {method}\n"
+        f"restart         : {restart}\n"
+        f"order           : {order}\n"
+        f"collect_stats   : {collect_stats}\n"
+        "===================================================="
+    )
+
+    con = duckdb.connect(database=database, read_only=False)
+    create_solutions_table(con, solutions_table_name, restart=restart)
+    if order != "sample":
+        add_hardness_scores(con, table_name, cube_size=cube_size)
+    (n_unsolved,) = con.sql(f"""
+        SELECT count(*) FROM {table_name}
+        ANTI JOIN {solutions_table_name} USING (sample_idx)
+    """).fetchone()
+    logger.info(f"{n_unsolved} samples left to solve")
+
+    n_samples, n_solved = 0, 0
+    total_stats = SolveStats()
+    for results in tqdm(
+        iterate_solved_batches(
+            iterate_through_duckdb_samples(
+                table_name=table_name,
+                con=con.cursor(),
+                size=batch_size,
+                solutions_table_name=solutions_table_name,
+                order=order,
+            ),
+            cube_size=cube_size,
+            n_workers=n_workers,
+            method=method,
+            collect_stats=collect_stats,
+        ),
+        desc="\t⏩",
+        total=math.ceil(n_unsolved / batch_size),
+    ):
+        append_solutions(con, solutions_table_name, results)
+        n_samples += len(results)
+        n_solved += sum(result["status"] == "solved" for result in results)
+        if collect_stats:
+            batch_stats = batch_solve_stats(results)
+            logger.debug(f"Batch stats: {batch_stats.as_dict()}")
+            total_stats += batch_stats
+    logger.info(f"Solved {n_solved} of {n_samples} samples in {table_name}")
+    if collect_stats:
+        logger.info(f"Stats: {total_stats.as_dict()}")
+
+
+def create_solutions_table(con, solutions_table_name, restart=False):
+    """
+    Create the solutions table, with one row per solved sample:
+        sample_idx: the sample in the samples table
+        status: "solved" or "unsolvable"
+        placements: for each blokk of the sample, in the same order, the index of its
+            placement in get_placement_masks, or NULL when unsolvable
+        cached: whether the worker had already solved another sample with the same
+            multiset of shapes, and reused that solve
+        solve_seconds: time taken to solve the sample's multiset of shapes, or NULL
+            when cached, so that summing it only counts the searches that ran
+        stats: the SolveStats of solving the sample's multiset of shapes, or NULL
+            when cached or not collected
+    """
+    database_schema, _ = solutions_table_name.split(".")
+    con.sql(f"CREATE SCHEMA IF NOT EXISTS {database_schema}")
+    if restart:
+        logger.info(f"Recreating {solutions_table_name}")
+        con.sql(f"DROP TABLE IF EXISTS {solutions_table_name}")
+    con.sql(f"""
+        CREATE TABLE IF NOT EXISTS {solutions_table_name} (
+            sample_idx INT PRIMARY KEY,
+            status VARCHAR,
+            placements USMALLINT[],
+            cached BOOLEAN,
+            solve_seconds DOUBLE,
+            stats {STATS_SQL_TYPE}
+        )
+    """)
+    # tables created before stats were collected
+    con.sql(f"""
+        ALTER TABLE {solutions_table_name} ADD COLUMN IF NOT EXISTS cached BOOLEAN;
+        ALTER TABLE {solutions_table_name}
+            ADD COLUMN IF NOT EXISTS stats {STATS_SQL_TYPE};
+    """)
+
+
+def append_solutions(
+    con, solutions_table_name, results: list[dict], on_conflict="error"
+):
+    """
+    Append a batch of results from _solve_a_batch in one insert. With
+    on_conflict="ignore", results for samples that already have one are dropped.
+    """
+    import polars as pl
+
+    df = pl.DataFrame(
+        results,
+        schema={
+            "sample_idx": pl.Int32,
+            "status": pl.Utf8,
+            "placements": pl.List(pl.UInt16),
+            "cached": pl.Boolean,
+            "solve_seconds": pl.Float64,
+            "stats": pl.Struct(
+                {
+                    name: pl.Int64 if isinstance(value, int) else pl.Float64
+                    for name, value in SolveStats().as_dict().items()
+                }
+            ),
+        },
+    )
+    or_ignore = {"error": "", "ignore": "OR IGNORE"}[on_conflict]
+    con.sql(f"INSERT {or_ignore} INTO {solutions_table_name} BY NAME SELECT * FROM df")
+
+
+def batch_solve_stats(results: list[dict]) -> SolveStats:
+    """
+    The sum of the stats of the solves of a batch of results from _solve_a_batch.
+    Cached results have no stats, so every search that ran is counted once.
+    """
+    return sum_stats(
+        SolveStats.from_dict(result["stats"])
+        for result in results
+        if result["stats"] is not None
+    )
+
+
+def iterate_solved_batches(
+    batches: Iterable[list[tuple[int, int]]],
+    cube_size,
+    n_workers=None,
+    method="occupancy",
+    collect_stats=False,
+) -> Generator[list[dict]]:
+    """
+    Stream batches of samples to a process pool, and yield the solved batches in the
+    order they were read.
+    """
+    n_workers = n_workers or os.cpu_count()
+    with ProcessPoolExecutor(
+        max_workers=n_workers,
+        mp_context=multiprocessing.get_context(WORKER_START_METHOD),
+        initializer=_init_worker,
+        initargs=(cube_size,),
+    ) as pool:
+        yield from _ordered_imap(
+            pool,
+            _solve_a_batch,
+            ((batch, cube_size, method, collect_stats) for batch in batches),
+            # keep every worker busy, without reading the whole table into memory
+            max_in_flight=2 * n_workers,
+        )
+
 
 def iterate_through_duckdb_samples(
     table_name,
-    database,
+    con,
     size=10000,
-    loglevel="INFO",
-):
-    with duckdb.connect(database=database, read_only=True) as read_con:
-        query = read_con.execute(f"""
-            select blokks, from {table_name}
-        """)
+    solutions_table_name=None,
+    order="sample",
+) -> Generator[list[tuple[int, int]]]:
+    """
+    Yield batches of (sample_idx, blokk_set) rows in one of the SAMPLE_ORDERS, skipping
+    the samples that already have a row in solutions_table_name.
+    """
+    query = f"SELECT sample_idx, blokk_set FROM {table_name}"
+    if solutions_table_name is not None:
+        query += f" ANTI JOIN {solutions_table_name} USING (sample_idx)"
+    result = con.execute(query + f" ORDER BY {SAMPLE_ORDERS[order]}")
+
+    while batch := result.fetchmany(size=size):
+        logger.debug(f"N={len(batch)}")
+        yield batch
+
+
+def _init_worker(cube_size):
+    # load every blokk's placements once per worker, so that batches only pay for
+    # the search
+    for blokk in get_blokks():
+        get_placement_masks(blokk.voxels, cube_size=cube_size)
+
+
+def _solve_a_batch(args) -> list[dict]:
+    batch, cube_size, method, collect_stats = args
+    id_to_shape_class = get_id_to_shape_class()
+    results = []
+    for sample_idx, blokk_set in batch:
+        blokk_ids = BlokkSet(blokk_set)
+        hits = _solve_shape_classes.cache_info().hits
+        shape_class_placements, solve_seconds, stats = _solve_shape_classes(
+            shape_class_key(blokk_ids),
+            cube_size=cube_size,
+            method=method,
+            collect_stats=collect_stats,
+        )
+        # the timings and stats of a solve are only stored with the sample that ran
+        # it, so that summing them does not count it again for every sample with the
+        # same shapes
+        cached = _solve_shape_classes.cache_info().hits > hits
+        placements = None
+        if shape_class_placements is not None:
+            # blokks of one shape class are interchangeable, hand out their placements
+            # in id order
+            unused = {c: iter(p) for c, p in shape_class_placements.items()}
+            placements = [next(unused[id_to_shape_class[i]]) for i in blokk_ids]
+        results.append(
+            {
+                "sample_idx": sample_idx,
+                "status": "unsolvable" if placements is None else "solved",
+                "placements": placements,
+                "cached": cached,
+                "solve_seconds": None if cached else solve_seconds,
+                "stats": None if cached else stats,
+            }
+        )
+    return results
+
+
+@lru_cache(maxsize=100_000)
+def _solve_shape_classes(
+    key, cube_size, method, collect_stats=False
+) -> tuple[Optional[dict[int, list[int]]], float, Optional[dict]]:
+    # samples made of the same shapes are the same puzzle, so each worker solves
+    # every multiset of shapes only once. Returns the placement indices of each shape
+    # class, or None if unsolvable, the time it took and, with collect_stats, the
+    # SolveStats as a dict.
+    stats = SolveStats() if collect_stats else None
+    start = time.perf_counter()
+    build = solve_bitmasks(
+        blokk_ids=shape_class_representative(key),
+        cube_size=cube_size,
+        method=method,
+        stats=stats,
+    )
+    solve_seconds = time.perf_counter() - start
+    stats = None if stats is None else stats.as_dict()
+    if build is None:
+        return None, solve_seconds, stats
 
-        while batch := query.fetchmany(size=size):
-            logger.debug(f"N={len(batch)}")
-            # solve the batch
-            _solve_a_batch(batch)
+    id_to_shape_class = get_id_to_shape_class()
+    shape_class_placements = defaultdict(list)
+    for blokk in get_blokks(build):
+        masks = get_placement_masks(blokk.voxels, cube_size=cube_size)
+        shape_class_placements[id_to_shape_class[blokk.id]].append(
+            masks.index(build[blokk.id])
+        )
+    return dict(shape_class_placements), solve_seconds, stats
 
 
-def _solve_a_batch(batch):
-    for blokk_ids in batch:
-        pass
+def _ordered_imap(
+    pool: Executor, fn: Callable, iterable: Iterable, max_in_flight: int
+) -> Generator:
+    # like pool.map, but only max_in_flight tasks are submitted at any time
+    in_flight: deque[Future] = deque()
+    for args in iterable:
+        in_flight.append(pool.submit(fn, args))
+        if len(in_flight) >= max_in_flight:
+            yield in_flight.popleft().result()
+    while in_flight:
+        yield in_flight.popleft().result()
 
 
 if __name__ == "__main__":
-    iterate_through_duckdb_samples(
-        table_name="blokk.cube_2.samples_5",
+    solve_samples_on_db(
         database="blokk.duckdb",
-        size=20,
+        cube_size=2,
+        max_blokk_volume=5,
+        batch_size=20,
     )
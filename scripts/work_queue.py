@@ -0,0 +1,316 @@
+import logging
+import os
+import random
+import socket
+import time
+from typing import Optional
+
+import duckdb
+
+from scripts.solve_on_db import (
+    _init_worker,
+    _solve_a_batch,
+    append_solutions,
+    batch_solve_stats,
+    create_solutions_table,
+)
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.DEBUG)
+
+# A DuckDB file can only be open for writing in one process at a time, so workers
+# hold a connection only long enough to claim or commit a batch, and wait their turn
+# while another worker has it open.
+CONNECT_TIMEOUT_SECONDS = 120
+
+
+def run_queue_worker(
+    database="blokk.duckdb",
+    cube_size=2,
+    max_blokk_volume=5,
+    database_schema=None,
+    method="occupancy",
+    worker_id=None,
+    lease_seconds=600,
+    max_attempts=3,
+    poll_seconds=30,
+    collect_stats=False,
+    loglevel="INFO",
+):
+    """
+    Solve batches of the samples table until none are left: claim a batch, solve it,
+    commit its results. Start as many workers as there are cores, on as many
+    machines as share the database file.
+
+    A claim is a lease on one batch_idx for lease_seconds. A worker that dies loses
+    its lease when it expires, and the batch is handed out again. Batches that raise
+    or outlive their lease are marked failed, and tried up to max_attempts times.
+    While other workers hold leases, a worker with nothing to claim waits for them to
+    finish or expire, checking every poll_seconds, so the batch of a worker that
+    died is solved even if no other worker is started. A worker only stops once no
+    batch is pending, in progress or left to retry.
+
+    With collect_stats, the SolveStats of every solve are saved with the result of
+    the sample that ran it, as in solve_samples_on_db.
+    """
+    logging.getLogger().setLevel(loglevel)
+
+    if database_schema is None:
+        database_schema = f"cube_{cube_size}"
+    table_name = f"{database_schema}.samples_{max_blokk_volume}"
+    solutions_table_name = f"{database_schema}.solutions_{max_blokk_volume}"
+    queue_table_name = f"{database_schema}.batch_queue_{max_blokk_volume}"
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+
+    logger.info(
+        "\n==== run_queue_worker ============================\n"
+        f"database        : {database}\n"
+        f"table_name      : {table_name}\n"
+        f"queue_table     : {queue_table_name}\n"
+        f"worker_id       : {worker_id}\n"
+        f"lease_seconds   : {lease_seconds}\n"
+        "===================================================="
+    )
+
+    with connect_with_retry(database) as con:
+        create_solutions_table(con, solutions_table_name)
+        create_work_queue(con, table_name, queue_table_name)
+    _init_worker(cube_size)
+
+    n_batches = 0
+    while True:
+        with connect_with_retry(database) as con:
+            batch_idx = claim_batch(
+                con,
+                queue_table_name,
+                worker_id=worker_id,
+                lease_seconds=lease_seconds,
+                max_attempts=max_attempts,
+            )
+            if batch_idx is None:
+                wait = seconds_to_lease_expiry(con, queue_table_name)
+                if wait is None:
+                    break
+            else:
+                batch = con.execute(
+                    f"""
+                    SELECT sample_idx, blokk_set FROM {table_name}
+                    ANTI JOIN {solutions_table_name} USING (sample_idx)
+                    WHERE batch_idx = ?
+                    ORDER BY sample_idx
+                    """,
+                    [batch_idx],
+                ).fetchall()
+
+        if batch_idx is None:
+            logger.info(f"Waiting up to {wait:.0f}s for the leases of other workers")
+            time.sleep(min(wait, poll_seconds))
+            continue
+
+        try:
+            results = _solve_a_batch((batch, cube_size, method, collect_stats))
+        except Exception as e:
+            logger.exception(f"Batch {batch_idx} failed")
+            with connect_with_retry(database) as con:
+                fail_batch(con, queue_table_name, batch_idx, worker_id, error=repr(e))
+            continue
+
+        with connect_with_retry(database) as con:
+            complete_batch(
+                con,
+                queue_table_name,
+                batch_idx,
+                worker_id,
+                results=results,
+                solutions_table_name=solutions_table_name,
+            )
+        n_batches += 1
+        logger.debug(f"Committed batch {batch_idx} ({len(results)} samples)")
+        if collect_stats:
+            logger.debug(
+                f"Batch {batch_idx} stats: {batch_solve_stats(results).as_dict()}"
+            )
+
+    with connect_with_retry(database) as con:
+        report_progress(con, queue_table_name)
+    logger.info(f"Worker {worker_id} finished after {n_batches} batches")
+
+
+def create_work_queue(con, table_name, queue_table_name, restart=False):
+    """
+    Create the queue table, with one row per batch_idx of the samples table, and add
+    any batches that are missing from it. Safe to call from every worker.
+    """
+    if restart:
+        con.sql(f"DROP TABLE IF EXISTS {queue_table_name}")
+    con.sql(f"""
+        CREATE TABLE IF NOT EXISTS {queue_table_name} (
+            batch_idx INT PRIMARY KEY,
+            status VARCHAR DEFAULT 'pending',
+            worker_id VARCHAR,
+            lease_expires TIMESTAMPTZ,
+            attempts INT DEFAULT 0,
+            n_samples INT,
+            started_at TIMESTAMPTZ,
+            finished_at TIMESTAMPTZ,
+            error VARCHAR
+        )
+    """)
+    con.sql(f"""
+        INSERT INTO {queue_table_name} (batch_idx)
+        SELECT DISTINCT batch_idx FROM {table_name}
+        ANTI JOIN {queue_table_name} USING (batch_idx)
+        ORDER BY batch_idx
+    """)
+
+
+def claim_batch(
+    con, queue_table_name, worker_id, lease_seconds=600, max_attempts=3
+) -> Optional[int]:
+    """
+    Lease the lowest batch that is pending, or failed fewer than max_attempts times,
+    to worker_id. Expired leases are reclaimed first, as failed batches, so that a
+    batch that keeps killing its worker or overrunning its lease is not retried
+    more than max_attempts times either. Returns None when there is nothing left to
+    claim.
+    """
+    con.begin()
+    try:
+        reclaimed = con.execute(f"""
+            UPDATE {queue_table_name} SET
+                status = 'failed',
+                error = 'lease expired',
+                finished_at = now()
+            WHERE status = 'in_progress' AND lease_expires < now()
+            RETURNING batch_idx
+        """).fetchall()
+        if reclaimed:
+            logger.warning(
+                f"Reclaimed expired leases of batches {sorted(b for (b,) in reclaimed)}"
+            )
+        claimed = con.execute(
+            f"""
+            UPDATE {queue_table_name} SET
+                status = 'in_progress',
+                worker_id = $worker_id,
+                lease_expires = now() + to_seconds($lease_seconds),
+                attempts = attempts + 1,
+                started_at = now(),
+                error = NULL
+            WHERE batch_idx = (
+                SELECT min(batch_idx) FROM {queue_table_name}
+                WHERE status = 'pending'
+                    OR (status = 'failed' AND attempts < $max_attempts)
+            )
+            RETURNING batch_idx
+            """,
+            {
+                "worker_id": worker_id,
+                "lease_seconds": lease_seconds,
+                "max_attempts": max_attempts,
+            },
+        ).fetchone()
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    return None if claimed is None else claimed[0]
+
+
+def seconds_to_lease_expiry(con, queue_table_name) -> Optional[float]:
+    """
+    The seconds until the earliest lease of a batch in progress expires, or None
+    when no batch is in progress.
+    """
+    (seconds,) = con.sql(f"""
+        SELECT epoch(min(lease_expires) - now()) FROM {queue_table_name}
+        WHERE status = 'in_progress'
+    """).fetchone()
+    # a lease is reclaimed once it has expired, not when it expires
+    return None if seconds is None else max(seconds, 0) + 0.01
+
+
+def complete_batch(
+    con, queue_table_name, batch_idx, worker_id, results, solutions_table_name
+):
+    """
+    Append the results of a batch and mark it done, in one transaction. If the lease
+    expired and the batch was solved again by another worker, the duplicate results
+    are dropped.
+    """
+    con.begin()
+    try:
+        append_solutions(con, solutions_table_name, results, on_conflict="ignore")
+        con.execute(
+            f"""
+            UPDATE {queue_table_name} SET
+                status = 'done',
+                worker_id = ?,
+                n_samples = ?,
+                finished_at = now()
+            WHERE batch_idx = ?
+            """,
+            [worker_id, len(results), batch_idx],
+        )
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+
+
+def fail_batch(con, queue_table_name, batch_idx, worker_id, error):
+    con.execute(
+        f"""
+        UPDATE {queue_table_name} SET status = 'failed', error = ?, finished_at = now()
+        WHERE batch_idx = ? AND worker_id = ?
+        """,
+        [error, batch_idx, worker_id],
+    )
+
+
+def report_progress(con, queue_table_name) -> dict:
+    """
+    Log and return the number of batches per status, and the throughput of the done
+    batches in samples per second.
+    """
+    status_counts = dict(
+        con.sql(f"""
+            SELECT status, count(*) FROM {queue_table_name} GROUP BY status
+        """).fetchall()
+    )
+    n_samples, elapsed = con.sql(f"""
+        SELECT sum(n_samples), epoch(max(finished_at) - min(started_at))
+        FROM {queue_table_name} WHERE status = 'done'
+    """).fetchone()
+    progress = {
+        **status_counts,
+        "samples_done": n_samples or 0,
+        "samples_per_second": (n_samples / elapsed) if elapsed else None,
+    }
+    logger.info(f"Queue {queue_table_name}: {progress}")
+    return progress
+
+
+def connect_with_retry(database, timeout=CONNECT_TIMEOUT_SECONDS):
+    """
+    Open the database for writing, waiting while another process has it open.
+    """
+    deadline = time.monotonic() + timeout
+    wait = 0.01
+    while True:
+        try:
+            return duckdb.connect(database=database, read_only=False)
+        except duckdb.IOException:
+            if time.monotonic() > deadline:
+                raise
+            # jitter, so that waiting workers do not retry in lockstep
+            time.sleep(wait * (1 + random.random()))
+            wait = min(2 * wait, 1.0)
+
+
+if __name__ == "__main__":
+    run_queue_worker(
+        database="blokk.duckdb",
+        cube_size=2,
+        max_blokk_volume=5,
+    )
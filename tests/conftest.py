@@ -0,0 +1,10 @@
+import pytest
+
+
+@pytest.fixture(scope="session", autouse=True)
+def placement_cache(tmp_path_factory):
+    # keep the placement cache of the tests out of the working directory
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        cache_dir = tmp_path_factory.mktemp("placement_cache")
+        monkeypatch.setenv("BLOKK_PLACEMENT_CACHE", str(cache_dir))
+        yield cache_dir
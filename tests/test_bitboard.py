@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from blokk_solver.bitboard import (
+    bitboard_to_bitmask,
+    bitmask_to_placement,
+    bitmasks_to_bitboards,
+    cell_rotations,
+    cell_to_voxel,
+    full_bitmask,
+    n_words,
+    overlaps,
+    placement_to_bitmask,
+    rotate_bitmask,
+    voxel_to_cell,
+)
+from blokk_solver.blokks import get_blokks, shape_to_game_board
+from blokk_solver.geometry import generate_all_placements
+
+
+@pytest.mark.parametrize(argnames="cube_size", argvalues=[1, 2, 3, 4, 5])
+def test_cell_order_matches_flattened_board(cube_size):
+    for cell in range(cube_size**3):
+        voxel = cell_to_voxel(cell, cube_size)
+        assert voxel_to_cell(voxel, cube_size) == cell
+        board = shape_to_game_board(frozenset([voxel]), n=cube_size, flatten=True)
+        assert board[cell] == 1
+
+
+@pytest.mark.parametrize(
+    argnames="cube_size,expected_words",
+    argvalues=[(1, 1), (2, 1), (3, 1), (4, 1), (5, 2), (6, 4)],
+)
+def test_n_words(cube_size, expected_words):
+    assert n_words(cube_size) == expected_words
+
+
+@pytest.mark.parametrize(argnames="cube_size", argvalues=[3, 5])
+def test_bitboards_roundtrip(cube_size):
+    voxels = get_blokks(ids={12})[0].voxels
+    placements = sorted(
+        generate_all_placements(voxels, cube_size=cube_size), key=sorted
+    )
+    masks = [placement_to_bitmask(placement, cube_size) for placement in placements]
+    bitboards = bitmasks_to_bitboards(masks, cube_size)
+    assert bitboards.shape == (len(placements), n_words(cube_size))
+    assert bitboards.dtype == np.uint64
+    for placement, mask, bitboard in zip(placements, masks, bitboards):
+        assert bitboard_to_bitmask(bitboard) == mask
+        assert bitmask_to_placement(mask, cube_size) == placement
+        assert mask & full_bitmask(cube_size) == mask
+
+
+def test_overlaps():
+    cube_size = 5
+    # the first and last cells of a 5x5x5 board live in different words
+    a, b, c = bitmasks_to_bitboards(
+        [
+            placement_to_bitmask(placement, cube_size)
+            for placement in [
+                {(0, 0, 0), (0, 0, 1)},
+                {(4, 4, 4)},
+                {(0, 0, 1), (4, 4, 4)},
+            ]
+        ],
+        cube_size,
+    )
+    assert not overlaps(a, b)
+    assert overlaps(a, c)
+    assert overlaps(b, c)
+    assert list(overlaps(a, np.stack([a, b, c]))) == [True, False, True]
+
+
+@pytest.mark.parametrize(argnames="cube_size", argvalues=[2, 3, 4, 5])
+def test_cell_rotations(cube_size):
+    rotations = cell_rotations(cube_size)
+    assert len(set(rotations)) == 24
+    assert rotations[0] == tuple(range(cube_size**3))
+    for rotation in rotations:
+        assert sorted(rotation) == list(range(cube_size**3))
+    # rotating the placements of a blokk gives its placements again
+    voxels = get_blokks(ids={13})[0].voxels
+    masks = {
+        placement_to_bitmask(placement, cube_size)
+        for placement in generate_all_placements(voxels, cube_size=cube_size)
+    }
+    for rotation in rotations:
+        assert {rotate_bitmask(mask, rotation) for mask in masks} == masks
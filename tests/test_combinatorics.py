@@ -1,8 +1,19 @@
+from collections import Counter
+
 import pytest  # noqa
 
 from blokk_solver._blokk_data import ways_to_sample_c3_from_v4
-from blokk_solver.blokks import Blokk, get_blokks
-from blokk_solver.combinatorics import BlokkCombinatorics
+from blokk_solver.blokks import (
+    Blokk,
+    BlokkSet,
+    get_blokks,
+    get_id_to_shape_class,
+    get_registry,
+    shape_class_key,
+    shape_class_representative,
+)
+from blokk_solver.combinatorics import BlokkCombinatorics, generate_bounded_partitions
+from pads.IntegerPartition import mckay
 
 
 @pytest.fixture()
@@ -10,6 +21,16 @@ def blokks() -> list[Blokk]:
     return get_blokks()
 
 
+def test_shape_classes():
+    id_to_shape_class = get_id_to_shape_class()
+    # ids 3 and 4 are both straight triominoes
+    assert id_to_shape_class[3] == id_to_shape_class[4] == 3
+    assert id_to_shape_class[12] != id_to_shape_class[13]
+    assert shape_class_key({3, 4, 12, 17}) == ((3, 2), (12, 2))
+    assert set(shape_class_representative(((3, 2), (12, 2)))) == {3, 4, 12, 17}
+    assert shape_class_key(shape_class_representative(((6, 3),))) == ((6, 3),)
+
+
 # Test for the trivial cases with low volume
 @pytest.mark.parametrize(
     argnames="max_blokk_volume,cube_size,expected_samples",
@@ -33,6 +54,201 @@ def test_trivial_all_blokk_samples(max_blokk_volume, cube_size, expected_samples
         max_blokk_volume=max_blokk_volume, cube_size=cube_size
     )
     samples = [s for _, s in combinatorics.generate_all_blokk_samples()]
-    expected_samples = set([frozenset(x) for x in expected_samples])
+    expected_samples = set([BlokkSet.from_ids(x) for x in expected_samples])
     assert set(samples) == expected_samples
     assert len(samples) == len(expected_samples)
+
+
+@pytest.mark.parametrize(argnames="start_integer_partition_idx", argvalues=[0, 1, 2, 3])
+def test_resume_from_integer_partition(start_integer_partition_idx):
+    combinatorics = BlokkCombinatorics(max_blokk_volume=4, cube_size=3)
+    all_samples = list(combinatorics.generate_all_blokk_samples())
+    resumed_samples = list(
+        combinatorics.generate_all_blokk_samples(
+            start_integer_partition_idx=start_integer_partition_idx
+        )
+    )
+    assert resumed_samples == [
+        (idx, sample)
+        for idx, sample in all_samples
+        if idx >= start_integer_partition_idx
+    ]
+
+
+@pytest.mark.parametrize(argnames="num_shards", argvalues=[1, 2, 3, 7, 50])
+def test_shards_partition_the_samples(num_shards):
+    combinatorics = BlokkCombinatorics(max_blokk_volume=4, cube_size=3)
+    all_samples = list(combinatorics.generate_all_blokk_samples())
+    shards = [
+        list(
+            combinatorics.generate_all_blokk_samples(shard=shard, num_shards=num_shards)
+        )
+        for shard in range(num_shards)
+    ]
+    # the shards are consecutive ranges of the samples, of nearly equal size
+    assert [sample for shard in shards for sample in shard] == all_samples
+    assert max(map(len, shards)) - min(map(len, shards)) <= 1
+    for shard, samples in enumerate(shards):
+        start, stop = combinatorics.shard_sample_range(shard, num_shards)
+        assert samples == all_samples[start:stop]
+        assert [
+            (idx, BlokkSet(int(mask)))
+            for idx, masks in combinatorics.generate_blokk_sample_masks(
+                shard=shard, num_shards=num_shards, chunk_size=2
+            )
+            for mask in masks
+        ] == samples
+
+
+@pytest.mark.parametrize(
+    argnames="max_blokk_volume,chunk_size", argvalues=[(4, 1), (5, 1000), (5, 1 << 20)]
+)
+def test_sample_masks_match_samples(max_blokk_volume, chunk_size):
+    combinatorics = BlokkCombinatorics(max_blokk_volume=max_blokk_volume, cube_size=3)
+    sample_masks = [
+        (idx, BlokkSet(int(mask)))
+        for idx, masks in combinatorics.generate_blokk_sample_masks(
+            chunk_size=chunk_size
+        )
+        for mask in masks
+    ]
+    assert sample_masks == list(combinatorics.generate_all_blokk_samples())
+
+
+def test_stop_integer_partition_idx():
+    combinatorics = BlokkCombinatorics(max_blokk_volume=4, cube_size=3)
+    samples = list(
+        combinatorics.generate_all_blokk_samples(
+            start_integer_partition_idx=1, stop_integer_partition_idx=2
+        )
+    )
+    assert {idx for idx, _ in samples} == {1}
+
+
+@pytest.mark.parametrize(
+    argnames="n,max_multiplicity",
+    argvalues=[
+        (0, {}),
+        (1, {}),
+        (8, {1: 1, 2: 1}),
+        (8, {1: 8}),
+        (12, {1: 1, 2: 1, 3: 2, 4: 7}),
+        (27, {1: 1, 2: 1, 3: 2, 4: 7, 5: 25}),
+        (27, {2: 3, 5: 4, 7: 1}),
+    ],
+)
+def test_bounded_partitions_match_filtered_mckay(n, max_multiplicity):
+    expected = [
+        list(partition)
+        for partition in mckay(n)
+        if all(
+            partition.count(part) <= max_multiplicity.get(part, 0)
+            for part in set(partition)
+        )
+    ]
+    assert list(generate_bounded_partitions(n, max_multiplicity)) == expected
+
+
+@pytest.mark.parametrize(argnames="max_blokk_volume", argvalues=[None, 3, 4])
+def test_integer_partitions_are_feasible(max_blokk_volume):
+    combinatorics = BlokkCombinatorics(max_blokk_volume=max_blokk_volume, cube_size=3)
+    for partition in combinatorics.generate_integer_partitions():
+        assert sum(partition) == 27
+        assert any(
+            combinatorics.generate_blokk_samples_from_integer_partition(partition)
+        )
+
+
+@pytest.mark.parametrize(
+    argnames="max_blokk_volume,cube_size",
+    argvalues=[(0, 1), (1, 1), (None, 1), (None, 2), (3, 3), (4, 3), (None, 3)],
+)
+def test_count_samples(max_blokk_volume, cube_size):
+    combinatorics = BlokkCombinatorics(
+        max_blokk_volume=max_blokk_volume, cube_size=cube_size
+    )
+    partition_counts = Counter(
+        idx for idx, _ in combinatorics.generate_all_blokk_samples()
+    )
+    per_partition = combinatorics.count_samples_per_integer_partition()
+    assert per_partition == [partition_counts[i] for i in range(len(per_partition))]
+    assert combinatorics.count_samples() == partition_counts.total()
+
+
+def test_locate_sample():
+    combinatorics = BlokkCombinatorics(max_blokk_volume=4, cube_size=3)
+    offsets = Counter()
+    for sample_idx, (idx, _) in enumerate(combinatorics.generate_all_blokk_samples()):
+        assert combinatorics.locate_sample(sample_idx) == (idx, offsets[idx])
+        offsets[idx] += 1
+    with pytest.raises(IndexError):
+        combinatorics.locate_sample(combinatorics.count_samples())
+
+
+@pytest.mark.parametrize(argnames="max_blokk_volume", argvalues=[2, 3, 4])
+def test_shape_class_samples_expand_to_all_samples(max_blokk_volume):
+    combinatorics = BlokkCombinatorics(max_blokk_volume=max_blokk_volume, cube_size=3)
+    keys = list(combinatorics.generate_shape_class_samples())
+    assert len(set(keys)) == len(keys)
+    expanded = [
+        (idx, sample)
+        for idx, key in keys
+        for sample in combinatorics.expand_shape_class_sample(key)
+    ]
+    assert sorted(expanded, key=lambda x: (x[0], sorted(x[1]))) == sorted(
+        combinatorics.generate_all_blokk_samples(), key=lambda x: (x[0], sorted(x[1]))
+    )
+    for _, key in keys:
+        for sample in combinatorics.expand_shape_class_sample(key):
+            assert shape_class_key(sample) == key
+
+
+@pytest.mark.parametrize(
+    argnames="a,b",
+    argvalues=[(set(), set()), ({1, 2, 3}, {3, 4}), ({36, 5}, {1, 36}), ({7}, set())],
+)
+def test_blokk_set_matches_frozenset(a, b):
+    blokk_a, blokk_b = BlokkSet.from_ids(a), BlokkSet.from_ids(b)
+    assert list(blokk_a) == sorted(a)
+    assert len(blokk_a) == len(a)
+    assert all(i in blokk_a for i in a) and 0 not in blokk_a
+    assert set(blokk_a | blokk_b) == a | b
+    assert set(blokk_a & blokk_b) == a & b
+    assert set(blokk_a - blokk_b) == a - b
+    assert set(blokk_a ^ blokk_b) == a ^ b
+    assert isinstance(blokk_a - blokk_b, BlokkSet)
+    assert blokk_a.issubset(blokk_a | blokk_b)
+    assert blokk_a.issubset(blokk_b) == (a <= b)
+
+    # with a plain int on the left
+    mask_b = int(blokk_b)
+    assert set(mask_b | blokk_a) == a | b
+    assert set(mask_b & blokk_a) == a & b
+    assert set(mask_b - blokk_a) == b - a
+    assert set(mask_b ^ blokk_a) == a ^ b
+    assert all(
+        isinstance(s, BlokkSet)
+        for s in [
+            mask_b | blokk_a,
+            mask_b & blokk_a,
+            mask_b - blokk_a,
+            mask_b ^ blokk_a,
+        ]
+    )
+    assert -1 not in blokk_a
+
+
+def test_registry_matches_blokks():
+    registry = get_registry()
+    assert get_registry() is registry
+    assert [b.id for b in get_blokks()] == list(range(1, 37))
+    for blokk in get_blokks():
+        assert registry.by_id[blokk.id] is blokk
+        assert registry.volumes[blokk.id] == blokk.volume == len(blokk.voxels)
+        assert registry.max_lengths[blokk.id] == blokk.max_length
+        assert registry.max_lengths[blokk.id] == registry.bounding_boxes[blokk.id].max()
+        assert registry.shape_classes[blokk.id] == get_id_to_shape_class()[blokk.id]
+        assert set(map(tuple, registry.voxels[blokk.id].tolist())) == blokk.voxels
+    with pytest.raises(ValueError):
+        registry.volumes[1] = 2
+    assert get_blokks({12, 3, 99}) == [registry.by_id[3], registry.by_id[12]]
@@ -0,0 +1,38 @@
+from blokk_solver.exact_cover import algorithm_x, build_columns
+
+
+def test_knuth_example():
+    # the example from Knuth's "Dancing Links" paper, with a single exact cover
+    rows = {
+        "A": [1, 4, 7],
+        "B": [1, 4],
+        "C": [4, 5, 7],
+        "D": [3, 5, 6],
+        "E": [2, 3, 6, 7],
+        "F": [2, 7],
+    }
+    columns = build_columns(rows)
+    covers = [sorted(cover) for cover in algorithm_x(columns, rows)]
+    assert covers == [["B", "D", "F"]]
+    # the search restores the columns it covered
+    assert columns == build_columns(rows)
+
+
+def test_all_covers_are_enumerated():
+    rows = {"a": [1], "b": [2], "ab": [1, 2]}
+    covers = [sorted(cover) for cover in algorithm_x(build_columns(rows), rows)]
+    assert sorted(covers) == [["a", "b"], ["ab"]]
+
+
+def test_no_cover():
+    rows = {"a": [1, 2], "b": [2, 3]}
+    assert list(algorithm_x(build_columns(rows), rows)) == []
+
+
+def test_columns_are_restored_when_stopping_early():
+    rows = {"a": [1], "b": [2], "ab": [1, 2]}
+    columns = build_columns(rows)
+    search = algorithm_x(columns, rows)
+    next(search)
+    search.close()
+    assert columns == build_columns(rows)
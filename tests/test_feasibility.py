@@ -0,0 +1,90 @@
+import random
+
+import pytest
+
+from blokk_solver.bitboard import cell_to_voxel, full_bitmask, voxel_to_cell
+from blokk_solver.feasibility import (
+    empty_regions,
+    is_feasible,
+    parity_imbalance,
+    regions_fillable,
+)
+from blokk_solver.solver import _get_id_to_masks
+
+
+def _flood_fill_regions(occupied, cube_size):
+    # the regions of empty cells, one voxel at a time
+    empty = {
+        cell_to_voxel(cell, cube_size)
+        for cell in range(cube_size**3)
+        if not occupied >> cell & 1
+    }
+    regions = []
+    while empty:
+        region, frontier = set(), [empty.pop()]
+        while frontier:
+            voxel = frontier.pop()
+            region.add(voxel)
+            for axis in range(3):
+                for step in (-1, 1):
+                    neighbour = list(voxel)
+                    neighbour[axis] += step
+                    if tuple(neighbour) in empty:
+                        empty.remove(tuple(neighbour))
+                        frontier.append(tuple(neighbour))
+        regions.append(sum(1 << voxel_to_cell(v, cube_size) for v in region))
+    return regions
+
+
+@pytest.mark.parametrize(
+    argnames="cube_size, expected_imbalance", argvalues=[(1, 1), (2, 0), (3, 1), (4, 0)]
+)
+def test_parity_imbalance_of_cube(cube_size, expected_imbalance):
+    assert parity_imbalance(full_bitmask(cube_size), cube_size) == expected_imbalance
+
+
+@pytest.mark.parametrize(argnames="cube_size", argvalues=[2, 3, 4])
+def test_empty_regions_match_flood_fill(cube_size):
+    rng = random.Random(cube_size)
+    for _ in range(50):
+        occupied = rng.getrandbits(cube_size**3)
+        assert sorted(empty_regions(occupied, cube_size)) == sorted(
+            _flood_fill_regions(occupied, cube_size)
+        )
+
+
+def test_regions_fillable():
+    # fill the middle layer of a 3x3x3 cube, leaving two regions of 9 cells
+    middle = sum(1 << voxel_to_cell((1, y, z), 3) for y in range(3) for z in range(3))
+    assert [r.bit_count() for r in empty_regions(middle, 3)] == [9, 9]
+    assert regions_fillable(middle, [4, 5, 4, 5], 3)
+    assert not regions_fillable(middle, [3, 5, 5, 5], 3)
+
+    # an isolated corner needs a blokk of volume 1
+    corner = full_bitmask(3) & ~1
+    assert regions_fillable(corner, [1], 3)
+    assert not regions_fillable(corner, [2], 3)
+
+
+@pytest.mark.parametrize(
+    argnames="blokk_ids, cube_size, feasible",
+    argvalues=[
+        ({7, 10, 11, 12, 24, 26}, 3, True),
+        ({2, 4, 6, 8, 10, 14, 34}, 3, True),
+        # 22 cells
+        ({7, 10, 11, 12, 24}, 3, False),
+        # blokk 13 is 4 cells long
+        ({7, 10, 11, 12, 24, 13}, 3, False),
+    ],
+)
+def test_is_feasible(blokk_ids, cube_size, feasible):
+    id_to_masks = _get_id_to_masks(blokk_ids, cube_size, "occupancy")
+    assert is_feasible(id_to_masks, cube_size) == feasible
+
+
+def test_is_feasible_rejects_parity():
+    # two blokks that can only cover even cells can never fill a 2x2x2 cube
+    even = sum(1 << cell for cell in range(8) if sum(cell_to_voxel(cell, 2)) % 2 == 0)
+    assert parity_imbalance(even, 2) == 4
+    assert not is_feasible({1: (even,), 2: (even,)}, 2)
+    assert is_feasible({1: (even,), 2: (full_bitmask(2) & ~even,)}, 2)
@@ -1,7 +1,17 @@
+import subprocess
+import sys
+
+import numpy as np
 import pytest
 
 from blokk_solver.blokks import get_blokks
-from blokk_solver.geometry import generate_all_placements, generate_rotations
+from blokk_solver.geometry import (
+    all_rotation_matrices,
+    generate_all_placements,
+    generate_placement_matrix,
+    generate_rotations,
+    generate_translations,
+)
 
 
 def test_blokk_2():
@@ -47,3 +57,43 @@ def test_blokk_12_placements(n, expected_placements):
     voxels = blokk12.voxels
     placements = generate_all_placements(voxels, cube_size=n)
     assert len(placements) == expected_placements
+
+
+@pytest.mark.parametrize(argnames="cube_size", argvalues=[1, 2, 3, 4])
+def test_placement_matrix_matches_rotations_and_translations(cube_size):
+    for blokk in get_blokks():
+        expected = {
+            frozenset(tuple(map(int, voxel)) for voxel in translation)
+            for rotation in generate_rotations(blokk.voxels)
+            for translation in generate_translations(rotation, cube_size=cube_size)
+        }
+        matrix = generate_placement_matrix(blokk.voxels, cube_size=cube_size)
+        assert matrix.shape == (len(expected), blokk.volume)
+        # rows are sorted and unique
+        assert [list(row) for row in matrix] == sorted(
+            sorted(list(row)) for row in matrix
+        )
+        assert len({tuple(row) for row in matrix}) == len(matrix)
+        assert generate_all_placements(blokk.voxels, cube_size=cube_size) == expected
+
+
+def test_all_rotation_matrices_form_the_octahedral_group():
+    rotations = all_rotation_matrices()
+    keys = {m.tobytes() for m in rotations}
+    assert len(keys) == 24
+    assert (rotations[0] == np.eye(3, dtype=int)).all()
+    for a in rotations:
+        assert (a @ a.T == np.eye(3, dtype=int)).all()
+        assert round(np.linalg.det(a)) == 1
+        for b in rotations:
+            assert (a @ b).tobytes() in keys
+
+
+def test_solver_import_is_light():
+    modules = subprocess.run(
+        [sys.executable, "-c", "import sys, blokk_solver.solver; print(*sys.modules)"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split()
+    assert not {"scipy", "plotly", "polars", "duckdb", "tqdm"} & set(modules)
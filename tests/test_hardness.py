@@ -0,0 +1,37 @@
+import math
+
+import pytest
+
+from blokk_solver.hardness import (
+    HARDNESS_INTERCEPT,
+    HARDNESS_WEIGHTS,
+    hardness_score,
+    sample_features,
+)
+from blokk_solver.solver import _get_id_to_masks
+
+
+@pytest.mark.parametrize(
+    argnames="blokk_ids,n_volume_5,log2_interchangeable",
+    argvalues=[
+        ({7, 10, 11, 12, 24, 26}, 3, 0),
+        # 19 and 21 have the same shape
+        ({3, 6, 19, 20, 21, 30}, 4, 1),
+        # 6, 8 and 10 have the same shape
+        ({2, 4, 6, 8, 10, 14, 34}, 2, math.log2(6)),
+    ],
+)
+def test_sample_features(blokk_ids, n_volume_5, log2_interchangeable):
+    features = sample_features(blokk_ids, cube_size=3)
+    assert features["n_blokks"] == len(blokk_ids)
+    assert features["n_volume_5"] == n_volume_5
+    assert features["log2_interchangeable"] == pytest.approx(log2_interchangeable)
+    id_to_masks = _get_id_to_masks(blokk_ids, 3, "occupancy")
+    assert features["log2_placements"] == pytest.approx(
+        math.log2(math.prod(len(masks) for masks in id_to_masks.values()))
+    )
+
+    assert hardness_score(blokk_ids, cube_size=3) == pytest.approx(
+        HARDNESS_INTERCEPT
+        + sum(weight * features[name] for name, weight in HARDNESS_WEIGHTS.items())
+    )
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from blokk_solver.blokks import get_blokks, get_id_to_placements
+from blokk_solver.geometry import generate_all_placements
+from blokk_solver.placement_cache import (
+    DEFAULT_CACHE_DIR,
+    get_placement_cells,
+    get_placement_masks,
+    placement_path,
+    shape_key,
+)
+
+
+def test_shape_key_is_rotation_invariant():
+    # ids 3 and 4 are both straight triominoes
+    blokk3, blokk4, blokk12 = get_blokks(ids={3, 4, 12})
+    assert shape_key(blokk3.voxels) == shape_key(blokk4.voxels)
+    assert shape_key(blokk3.voxels) != shape_key(blokk12.voxels)
+
+
+@pytest.mark.parametrize(argnames="cube_size", argvalues=[2, 3, 5])
+def test_placement_cells_are_cached_on_disk(tmp_path, cube_size):
+    voxels = get_blokks(ids={12})[0].voxels
+    path = placement_path(voxels, cube_size=cube_size, cache_dir=tmp_path)
+    assert not path.exists()
+
+    cells = get_placement_cells(voxels, cube_size=cube_size, cache_dir=tmp_path)
+    assert path.exists()
+    assert isinstance(cells, np.memmap)
+    assert cells.shape == (
+        len(generate_all_placements(voxels, cube_size=cube_size)),
+        len(voxels),
+    )
+    masks = get_placement_masks(voxels, cube_size=cube_size, cache_dir=tmp_path)
+    assert len(set(masks)) == len(cells)
+
+
+def test_cache_dir_defaults_to_the_environment(tmp_path, monkeypatch):
+    voxels = get_blokks(ids={12})[0].voxels
+    monkeypatch.setenv("BLOKK_PLACEMENT_CACHE", str(tmp_path))
+    assert placement_path(voxels, cube_size=3).is_relative_to(tmp_path)
+    monkeypatch.delenv("BLOKK_PLACEMENT_CACHE")
+    assert placement_path(voxels, cube_size=3).is_relative_to(DEFAULT_CACHE_DIR)
+
+
+def test_get_id_to_placements_matches_geometry():
+    id_to_placements = get_id_to_placements(cube_size=3)
+    for blokk in get_blokks():
+        assert id_to_placements[blokk.id] == {
+            frozenset(map(lambda voxel: tuple(map(int, voxel)), placement))
+            for placement in generate_all_placements(blokk.voxels, cube_size=3)
+        }
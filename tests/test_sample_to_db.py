@@ -0,0 +1,145 @@
+import shutil
+
+import duckdb
+import pyarrow.parquet as pq
+import pytest
+
+from blokk_solver.blokks import BlokkSet
+from blokk_solver.combinatorics import BlokkCombinatorics
+from blokk_solver.hardness import hardness_score
+from scripts.sample_to_db import (
+    add_hardness_scores,
+    iterate_sample_record_batches,
+    merge_sample_shards_to_duckdb,
+    stream_blokk_samples_to_duckdb,
+    stream_sharded_blokk_samples_to_duckdb,
+    write_blokk_samples_to_parquet,
+)
+
+
+def _samples(database, table_name="cube_3.samples_4") -> list[tuple]:
+    with duckdb.connect(database) as con:
+        return con.sql(f"""
+            SELECT sample_idx, integer_partition_idx, blokk_set, batch_idx
+            FROM {table_name} ORDER BY sample_idx
+        """).fetchall()
+
+
+@pytest.fixture(scope="module")
+def sequential_database(tmp_path_factory) -> str:
+    database = str(tmp_path_factory.mktemp("sequential") / "blokk.duckdb")
+    stream_blokk_samples_to_duckdb(database=database, cube_size=3, max_blokk_volume=4)
+    return database
+
+
+@pytest.fixture(scope="module")
+def sequential_samples(sequential_database) -> list[tuple]:
+    return _samples(sequential_database)
+
+
+def test_sharded_samples_match_sequential(tmp_path, sequential_samples):
+    database = str(tmp_path / "blokk.duckdb")
+    shard_dir = tmp_path / "shards"
+    for num_shards in [2, 3]:
+        # the shards of the first run are still in shard_dir, and must not be merged
+        stream_sharded_blokk_samples_to_duckdb(
+            database=database,
+            cube_size=3,
+            max_blokk_volume=4,
+            num_shards=num_shards,
+            n_jobs=1,
+            shard_dir=str(shard_dir),
+        )
+        assert _samples(database) == sequential_samples
+
+    # a shard that is still being written is not merged either
+    (shard_dir / "shard_0000_of_0003").rename(shard_dir / "shard_0000_of_0003.tmp")
+    with pytest.raises(FileNotFoundError):
+        merge_sample_shards_to_duckdb(
+            database=database,
+            cube_size=3,
+            max_blokk_volume=4,
+            shard_dir=str(shard_dir),
+            num_shards=3,
+        )
+
+
+@pytest.mark.parametrize(argnames="n_deleted", argvalues=[0, 1, 10, 42])
+def test_resume_is_idempotent(tmp_path, sequential_samples, n_deleted):
+    database = str(tmp_path / "blokk.duckdb")
+    # no table to resume from, so it starts from the beginning
+    stream_blokk_samples_to_duckdb(
+        database=database, cube_size=3, max_blokk_volume=4, restart=False
+    )
+    assert _samples(database) == sequential_samples
+
+    # an interrupted run, that stopped somewhere in the last integer partitions
+    with duckdb.connect(database) as con:
+        con.sql(f"""
+            DELETE FROM cube_3.samples_4
+            WHERE sample_idx > {len(sequential_samples) - n_deleted}
+        """)
+    for _ in range(2):
+        stream_blokk_samples_to_duckdb(
+            database=database, cube_size=3, max_blokk_volume=4, restart=False
+        )
+        rows = [
+            (integer_partition_idx, blokk_set)
+            for _, integer_partition_idx, blokk_set, _ in _samples(database)
+        ]
+        assert len(rows) == len(set(rows)) == len(sequential_samples)
+        assert set(rows) == {
+            (integer_partition_idx, blokk_set)
+            for _, integer_partition_idx, blokk_set, _ in sequential_samples
+        }
+
+
+@pytest.mark.parametrize(
+    argnames="chunk_size,batch_size",
+    argvalues=[(3, 10), (7, 5), (1, 4), (100, 9)],
+)
+def test_iterate_sample_record_batches(chunk_size, batch_size):
+    combinatorics = BlokkCombinatorics(max_blokk_volume=4, cube_size=3)
+    record_batches = list(
+        iterate_sample_record_batches(
+            combinatorics.generate_blokk_sample_masks(chunk_size=chunk_size),
+            batch_size=batch_size,
+        )
+    )
+    # every batch but the last is full
+    assert {len(b) for b in record_batches[:-1]} <= {batch_size}
+    assert 0 < len(record_batches[-1]) <= batch_size
+    rows = [
+        (row["integer_partition_idx"], row["blokk_set"])
+        for b in record_batches
+        for row in b.to_pylist()
+    ]
+    assert rows == list(combinatorics.generate_all_blokk_samples())
+
+
+def test_write_blokk_samples_to_parquet(tmp_path, sequential_samples):
+    path = tmp_path / "samples.parquet"
+    n_samples = write_blokk_samples_to_parquet(
+        path, cube_size=3, max_blokk_volume=4, batch_size=10
+    )
+    table = pq.read_table(path)
+    assert n_samples == table.num_rows == len(sequential_samples)
+    assert pq.ParquetFile(path).num_row_groups == -(-n_samples // 10)
+    # numbered and ordered like the samples table
+    assert [
+        (row["sample_idx"], row["integer_partition_idx"], row["blokk_set"])
+        for row in table.to_pylist()
+    ] == [row[:3] for row in sequential_samples]
+
+
+def test_add_hardness_scores_matches_hardness_score(sequential_database, tmp_path):
+    database = str(tmp_path / "blokk.duckdb")
+    shutil.copy(sequential_database, database)
+    with duckdb.connect(database) as con:
+        add_hardness_scores(con, "cube_3.samples_4", cube_size=3)
+        rows = con.sql("SELECT blokk_set, hardness FROM cube_3.samples_4").fetchall()
+    for blokk_set, hardness in rows:
+        # hardness is a REAL
+        assert hardness == pytest.approx(
+            hardness_score(BlokkSet(blokk_set), cube_size=3), abs=1e-5
+        )
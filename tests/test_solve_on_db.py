@@ -0,0 +1,136 @@
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import duckdb
+import pytest
+
+from blokk_solver.bitboard import full_bitmask
+from blokk_solver.blokks import (
+    BlokkSet,
+    get_blokks,
+    shape_class_key,
+    shape_class_representative,
+)
+from blokk_solver.placement_cache import get_placement_masks
+from blokk_solver.solver import solve_bitmasks
+from blokk_solver.stats import SolveStats, sum_stats
+from scripts.sample_to_db import stream_blokk_samples_to_duckdb
+from scripts.solve_on_db import (
+    _ordered_imap,
+    iterate_solved_batches,
+    iterate_through_duckdb_samples,
+    solve_samples_on_db,
+)
+
+SAMPLES = "cube_3.samples_4"
+SOLUTIONS = "cube_3.solutions_4"
+
+
+@pytest.fixture(scope="module")
+def samples_database(tmp_path_factory) -> str:
+    database = str(tmp_path_factory.mktemp("samples") / "blokk.duckdb")
+    stream_blokk_samples_to_duckdb(database=database, cube_size=3, max_blokk_volume=4)
+    return database
+
+
+@pytest.fixture
+def database(samples_database, tmp_path) -> str:
+    # a fresh copy, without solutions
+    database = str(tmp_path / "blokk.duckdb")
+    shutil.copy(samples_database, database)
+    return database
+
+
+def test_stats_count_every_search_once(database):
+    solve_samples_on_db(
+        database=database,
+        cube_size=3,
+        max_blokk_volume=4,
+        batch_size=10,
+        n_workers=1,
+        collect_stats=True,
+    )
+    with duckdb.connect(database) as con:
+        blokk_sets = [
+            b for (b,) in con.sql(f"SELECT blokk_set FROM {SAMPLES}").fetchall()
+        ]
+        n_solves, n_stats, n_seconds, nodes = con.sql(f"""
+            SELECT
+                count(*) FILTER (NOT cached),
+                count(stats),
+                count(solve_seconds),
+                sum(stats.nodes)
+            FROM {SOLUTIONS}
+        """).fetchone()
+
+    # one worker solves every multiset of shapes once
+    keys = {shape_class_key(BlokkSet(b)) for b in blokk_sets}
+    assert n_solves == n_stats == n_seconds == len(keys) < len(blokk_sets)
+    expected = []
+    for key in keys:
+        stats = SolveStats()
+        solve_bitmasks(shape_class_representative(key), cube_size=3, stats=stats)
+        expected.append(stats)
+    assert nodes == sum_stats(expected).nodes
+
+
+def test_placements_fill_the_cube_and_rerun_appends_nothing(database):
+    for _ in range(2):
+        solve_samples_on_db(
+            database=database, cube_size=3, max_blokk_volume=4, n_workers=2
+        )
+    with duckdb.connect(database) as con:
+        rows = con.sql(f"""
+            SELECT blokk_set, status, placements
+            FROM {SAMPLES} JOIN {SOLUTIONS} USING (sample_idx)
+        """).fetchall()
+        (n_samples,) = con.sql(f"SELECT count(*) FROM {SAMPLES}").fetchone()
+    # the second run found every sample solved
+    assert len(rows) == n_samples
+
+    for blokk_set, status, placements in rows:
+        assert status == "solved"
+        # one placement index per blokk, in id order
+        blokks = get_blokks(BlokkSet(blokk_set))
+        masks = [
+            get_placement_masks(blokk.voxels, cube_size=3)[placement]
+            for blokk, placement in zip(blokks, placements, strict=True)
+        ]
+        assert sum(mask.bit_count() for mask in masks) == 27
+        combined = 0
+        for mask in masks:
+            combined |= mask
+        assert combined == full_bitmask(3)
+
+
+def test_iterate_solved_batches_keeps_read_order(samples_database):
+    with duckdb.connect(samples_database, read_only=True) as con:
+        batches = list(iterate_through_duckdb_samples(SAMPLES, con, size=5))
+    solved = list(iterate_solved_batches(iter(batches), cube_size=3, n_workers=2))
+    assert [[r["sample_idx"] for r in results] for results in solved] == [
+        [sample_idx for sample_idx, _ in batch] for batch in batches
+    ]
+
+
+def test_ordered_imap():
+    lock = threading.Lock()
+    in_flight, max_seen = 0, 0
+
+    def slow_first(i):
+        nonlocal in_flight, max_seen
+        with lock:
+            in_flight += 1
+            max_seen = max(max_seen, in_flight)
+        # the first tasks finish last
+        time.sleep(0.01 * (10 - i))
+        with lock:
+            in_flight -= 1
+        return i
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        assert list(_ordered_imap(pool, slow_first, range(10), max_in_flight=3)) == (
+            list(range(10))
+        )
+    assert max_seen <= 3
@@ -1,6 +1,36 @@
+import json
+
 import pytest  # noqa
 
-from blokk_solver.solver import solve_all_now
+from blokk_solver import solver
+from blokk_solver.bitboard import bitmask_to_placement, placement_to_bitmask
+from blokk_solver.blokks import BlokkSet, shape_class_key, shape_class_representative
+from blokk_solver.combinatorics import BlokkCombinatorics
+from blokk_solver.occupancy import DeadEndCache, iter_packings
+from blokk_solver.solver import (
+    _break_symmetry,
+    _get_id_to_masks,
+    _iter_exact_cover,
+    count_solutions,
+    save_solutions,
+    solve,
+    solve_all_builds,
+    solve_all_now,
+    solve_bitmasks,
+    solve_iter,
+)
+from blokk_solver.stats import SolveStats, sum_stats
+
+
+def _assert_fills_cube(build, cube_size):
+    voxels = [voxel for placement in build for voxel in placement]
+    assert len(voxels) == cube_size**3
+    assert set(voxels) == {
+        (x, y, z)
+        for x in range(cube_size)
+        for y in range(cube_size)
+        for z in range(cube_size)
+    }
 
 
 # Test for the trivial cases with low volume
@@ -16,13 +46,280 @@ from blokk_solver.solver import solve_all_now
         (2, None, 0),
     ],
 )
-def test_trivial_cases(cube_size, max_blokk_volume, expected_number_of_solutions):
-    solutions = solve_all_now(cube_size=cube_size, max_blokk_volume=max_blokk_volume)
+@pytest.mark.parametrize(
+    argnames="method",
+    argvalues=["occupancy", "exact_cover", "product", "vectorized"],
+)
+@pytest.mark.parametrize(argnames="deduplicate_shapes", argvalues=[True, False])
+def test_trivial_cases(
+    cube_size,
+    max_blokk_volume,
+    expected_number_of_solutions,
+    method,
+    deduplicate_shapes,
+):
+    solutions = solve_all_now(
+        cube_size=cube_size,
+        max_blokk_volume=max_blokk_volume,
+        method=method,
+        deduplicate_shapes=deduplicate_shapes,
+    )
     assert len(solutions) == expected_number_of_solutions
 
 
-@pytest.mark.skip(reason="Too slow for a test")
+def test_solve_all_now_deduplicates_shapes(monkeypatch):
+    solved = []
+
+    def fake_solve(blokk_ids, cube_size, method, stats=None):
+        solved.append(shape_class_key(blokk_ids))
+        return {frozenset(blokk_ids)}
+
+    monkeypatch.setattr(solver, "solve", fake_solve)
+    solutions = solve_all_now(cube_size=3, max_blokk_volume=4, deduplicate_shapes=True)
+
+    combinatorics = BlokkCombinatorics(max_blokk_volume=4, cube_size=3)
+    # each multiset of shapes is solved once...
+    assert sorted(solved) == sorted(
+        key for _, key in combinatorics.generate_shape_class_samples()
+    )
+    assert len(solved) < len(solutions)
+    # ...and its build is shared by every sample with those shapes
+    assert sorted(sorted(s[0]["ids"]) for s in solutions) == sorted(
+        sorted(ids) for _, ids in combinatorics.generate_all_blokk_samples()
+    )
+    for [solution] in solutions:
+        [representative] = solution["first_winning_build"]
+        assert shape_class_key(representative) == shape_class_key(solution["ids"])
+
+
+@pytest.mark.parametrize(
+    argnames="blokk_ids,solvable",
+    argvalues=[
+        ({7, 10, 11, 12, 24, 26}, True),
+        ({2, 4, 6, 8, 10, 14, 34}, True),
+        ({2, 12, 21, 24, 32, 36}, False),
+    ],
+)
+@pytest.mark.parametrize(
+    argnames="method",
+    argvalues=["occupancy", "occupancy_pruned", "occupancy_memo", "exact_cover"],
+)
+def test_solve_3x3x3_subsets(blokk_ids, solvable, method):
+    build = solve(blokk_ids=blokk_ids, cube_size=3, method=method)
+    assert (build is not None) == solvable
+    if solvable:
+        assert len(build) == len(blokk_ids)
+        _assert_fills_cube(build, cube_size=3)
+
+
+def test_solve_bitmasks():
+    blokk_ids = {7, 10, 11, 12, 24, 26}
+    build = solve_bitmasks(blokk_ids, cube_size=3)
+    assert set(build) == blokk_ids
+    for blokk_id, mask in build.items():
+        assert mask in _get_id_to_masks({blokk_id}, 3, "occupancy")[blokk_id]
+    _assert_fills_cube(
+        [bitmask_to_placement(mask, 3) for mask in build.values()], cube_size=3
+    )
+    assert solve_bitmasks({2, 12, 21, 24, 32, 36}, cube_size=3) is None
+
+
+def test_dead_ends_are_shared_across_samples():
+    combinatorics = BlokkCombinatorics(max_blokk_volume=4, cube_size=3)
+    dead_ends = DeadEndCache()
+    for _, blokk_ids in combinatorics.generate_all_blokk_samples():
+        id_to_masks = _get_id_to_masks(blokk_ids, 3, "occupancy")
+        # symmetry breaking restricts one blokk, which must not be confused with the
+        # same blokk unrestricted in the cache
+        for masks in (id_to_masks, _break_symmetry(id_to_masks, 3)[0]):
+            assert next(iter_packings(masks, 3, dead_ends=dead_ends), None) == next(
+                iter_packings(masks, 3), None
+            )
+    assert dead_ends.hits > 0
+
+
+def test_dead_end_cache_evicts_least_recently_used():
+    dead_ends = DeadEndCache(maxsize=2)
+    dead_ends.add((1, 0))
+    dead_ends.add((2, 0))
+    assert (1, 0) in dead_ends
+    dead_ends.add((3, 0))
+    assert (2, 0) not in dead_ends
+    assert (1, 0) in dead_ends and (3, 0) in dead_ends
+    assert len(dead_ends) == 2
+
+
+@pytest.mark.parametrize(argnames="break_symmetry", argvalues=[True, False])
+def test_solve_with_and_without_symmetry_breaking(break_symmetry):
+    for blokk_ids, solvable in [
+        ({7, 10, 11, 12, 24, 26}, True),
+        ({2, 12, 21, 24, 32, 36}, False),
+    ]:
+        build = solve(blokk_ids, cube_size=3, break_symmetry=break_symmetry)
+        assert (build is not None) == solvable
+
+
+def test_solve_all_builds_up_to_symmetry():
+    blokk_ids = {7, 10, 11, 12, 24, 26}
+    builds = solve_all_builds(blokk_ids, cube_size=3)
+    all_builds = solve_all_builds(blokk_ids, cube_size=3, expand_symmetries=True)
+    for build in all_builds:
+        _assert_fills_cube(build, cube_size=3)
+    # every build is one of 24 rotations of a build that is not equivalent to another
+    assert len(builds) == 2
+    assert len(all_builds) == 24 * len(builds)
+
+    # the same builds as a search without symmetry breaking
+    id_to_masks = _get_id_to_masks(blokk_ids, 3, "exact_cover")
+    assert {
+        frozenset(placement_to_bitmask(placement, 3) for placement in build)
+        for build in all_builds
+    } == {frozenset(build) for build in _iter_exact_cover(id_to_masks, 3)}
+
+
+@pytest.mark.parametrize(
+    argnames="blokk_ids,expected_solutions",
+    argvalues=[
+        ({7, 10, 11, 12, 24, 26}, 48),
+        # 19 and 21 have the same shape, so they can swap places
+        ({3, 6, 19, 20, 21, 30}, 144),
+        ({2, 12, 21, 24, 32, 36}, 0),
+    ],
+)
+@pytest.mark.parametrize(
+    argnames="method",
+    argvalues=["occupancy", "occupancy_pruned", "occupancy_memo", "exact_cover"],
+)
+def test_solve_iter_yields_every_build_once(blokk_ids, expected_solutions, method):
+    builds = [
+        frozenset(build) for build in solve_iter(blokk_ids, cube_size=3, method=method)
+    ]
+    assert len(builds) == len(set(builds)) == expected_solutions
+    assert count_solutions(blokk_ids, cube_size=3, method=method) == expected_solutions
+    assert count_solutions(
+        blokk_ids, cube_size=3, method=method, up_to_symmetry=True
+    ) == (expected_solutions // 24)
+
+    id_to_masks = _get_id_to_masks(blokk_ids, 3, "exact_cover")
+    assert {
+        frozenset(placement_to_bitmask(placement, 3) for placement in build)
+        for build in builds
+    } == {frozenset(build) for build in _iter_exact_cover(id_to_masks, 3)}
+
+
+def test_solve_all_now_counts_solutions():
+    solutions = solve_all_now(cube_size=1, max_blokk_volume=1, count_all_solutions=True)
+    assert solutions == [
+        [
+            {
+                "ids": BlokkSet.from_ids([1]),
+                "first_winning_build": {frozenset({(0, 0, 0)})},
+                "n_solutions": 1,
+            }
+        ]
+    ]
+
+
+@pytest.mark.parametrize(
+    argnames="method",
+    argvalues=["occupancy", "occupancy_pruned", "occupancy_memo", "exact_cover"],
+)
+def test_solve_collects_stats(method):
+    stats = SolveStats()
+    assert solve({7, 10, 11, 12, 24, 26}, cube_size=3, method=method, stats=stats)
+    assert stats.load_seconds > 0 and stats.search_seconds > 0
+    assert stats.prunes["feasibility"] == 0
+    if method == "exact_cover":
+        assert stats.nodes == 0
+    else:
+        # every node but those on the path to the packing is a backtrack
+        assert stats.nodes > stats.backtracks > 0
+        assert stats.placements_considered > stats.nodes
+    assert (stats.prunes["regions"] > 0) == (method == "occupancy_pruned")
+
+    # counts add up over solves
+    more_stats = SolveStats()
+    solve({2, 12, 21, 24, 32, 36}, cube_size=3, method=method, stats=more_stats)
+    total = sum_stats([stats, more_stats])
+    assert total.nodes == stats.nodes + more_stats.nodes
+    assert SolveStats.from_dict(total.as_dict()) == total
+
+
+def test_record_max_rss(monkeypatch):
+    stats = SolveStats()
+    stats.record_max_rss()
+    # this process takes more than a megabyte, and less than a terabyte
+    assert 10**6 < stats.max_rss_bytes < 10**12
+
+    # macOS reports bytes, not kilobytes
+    monkeypatch.setattr("sys.platform", "darwin")
+    mac_stats = SolveStats()
+    mac_stats.record_max_rss()
+    assert mac_stats.max_rss_bytes * 1024 == pytest.approx(stats.max_rss_bytes, rel=0.1)
+
+
+def test_solve_counts_feasibility_prunes():
+    stats = SolveStats()
+    # blokk 13 is 4 cells long
+    assert solve({7, 10, 11, 12, 24, 13}, cube_size=3, stats=stats) is None
+    assert stats.prunes["feasibility"] == 1
+    assert stats.nodes == 0
+
+
+def test_solve_all_now_collects_stats():
+    solutions = solve_all_now(cube_size=1, max_blokk_volume=1, collect_stats=True)
+    stats = solutions[0][0]["stats"]
+    # the empty cube and the full one
+    assert stats["nodes"] == 2
+    assert stats["backtracks"] == 0
+    assert stats["prunes_feasibility"] == 0
+
+
+def test_solve_all_now_counts_every_search_once():
+    solutions = solve_all_now(cube_size=3, max_blokk_volume=4, collect_stats=True)
+    fresh = [s for [s] in solutions if not s["cached"]]
+    assert all(s["stats"] is None for [s] in solutions if s["cached"])
+    # one search per multiset of shapes
+    keys = {shape_class_key(s["ids"]) for [s] in solutions}
+    assert len(fresh) == len(keys) < len(solutions)
+    assert {shape_class_key(s["ids"]) for s in fresh} == keys
+    expected = []
+    for key in keys:
+        stats = SolveStats()
+        solve(shape_class_representative(key), cube_size=3, stats=stats)
+        expected.append(stats)
+    assert sum_stats(SolveStats.from_dict(s["stats"]) for s in fresh).nodes == (
+        sum_stats(expected).nodes
+    )
+
+
+def test_solve_iter_limit():
+    blokk_ids = {3, 6, 19, 20, 21, 30}
+    assert len(list(solve_iter(blokk_ids, cube_size=3, limit=10))) == 10
+    assert count_solutions(blokk_ids, cube_size=3, limit=10) == 10
+
+
+def test_save_solutions(tmp_path):
+    blokk_ids = {7, 10, 11, 12, 24, 26}
+    path = tmp_path / "solutions.jsonl"
+    assert save_solutions(blokk_ids, path, cube_size=3) == 48
+    lines = path.read_text().splitlines()
+    assert len(lines) == 48
+    for line in lines:
+        solution = json.loads(line)
+        assert {blokk_id for blokk_id, _ in solution} == blokk_ids
+        _assert_fills_cube(
+            [bitmask_to_placement(mask, 3) for _, mask in solution], cube_size=3
+        )
+
+
+def test_solve_unknown_method():
+    with pytest.raises(ValueError):
+        solve(blokk_ids={1}, cube_size=1, method="guess")
+
+
 def test_solve_3x3x3():
     solutions = solve_all_now(cube_size=3, max_blokk_volume=5)
-    # ...
-    # assert len(solutions) == 0  # ??
+    assert len(solutions) == 412041
+    # cross-checked against method="exact_cover"
+    assert sum(bool(s["first_winning_build"]) for [s] in solutions) == 268860
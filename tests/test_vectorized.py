@@ -0,0 +1,26 @@
+import pytest
+
+from blokk_solver.solver import _get_id_to_masks, _iter_product
+from blokk_solver.vectorized import iter_builds_vectorized
+
+
+@pytest.mark.parametrize(
+    argnames="blokk_ids,cube_size",
+    argvalues=[
+        ({1}, 1),
+        ({1, 2, 3}, 2),
+        ({1, 2, 5}, 2),
+        ({1, 2, 3}, 3),
+        ({2, 3, 12}, 3),
+    ],
+)
+@pytest.mark.parametrize(argnames="chunk_size", argvalues=[7, 1000, 1 << 20])
+def test_vectorized_matches_product(blokk_ids, cube_size, chunk_size):
+    id_to_masks = _get_id_to_masks(blokk_ids, cube_size, "product")
+    assert list(
+        iter_builds_vectorized(id_to_masks, cube_size, chunk_size=chunk_size)
+    ) == list(_iter_product(id_to_masks, cube_size))
+
+
+def test_vectorized_without_placements():
+    assert list(iter_builds_vectorized({1: (), 2: (1,)}, cube_size=2)) == []
@@ -0,0 +1,134 @@
+import time
+
+import duckdb
+import pytest
+
+from scripts.sample_to_db import stream_blokk_samples_to_duckdb
+from scripts.solve_on_db import create_solutions_table
+from scripts.work_queue import (
+    claim_batch,
+    complete_batch,
+    create_work_queue,
+    fail_batch,
+    report_progress,
+    run_queue_worker,
+    seconds_to_lease_expiry,
+)
+
+QUEUE = "cube_3.batch_queue_4"
+SOLUTIONS = "cube_3.solutions_4"
+
+
+@pytest.fixture
+def con(tmp_path):
+    # three batches of two samples each
+    with duckdb.connect(str(tmp_path / "blokk.duckdb")) as con:
+        con.sql("CREATE SCHEMA cube_3")
+        con.sql("""
+            CREATE TABLE cube_3.samples_4 AS
+            SELECT i AS sample_idx, 0::UBIGINT AS blokk_set, (i - 1) // 2 AS batch_idx
+            FROM range(1, 7) AS t(i)
+        """)
+        create_solutions_table(con, SOLUTIONS)
+        create_work_queue(con, "cube_3.samples_4", QUEUE)
+        yield con
+
+
+def _queue(con) -> list[tuple]:
+    return con.sql(f"""
+        SELECT batch_idx, status, worker_id, attempts FROM {QUEUE} ORDER BY batch_idx
+    """).fetchall()
+
+
+def _result(sample_idx) -> dict:
+    return {
+        "sample_idx": sample_idx,
+        "status": "unsolvable",
+        "placements": None,
+        "cached": False,
+        "solve_seconds": 0.0,
+        "stats": None,
+    }
+
+
+def test_claim_complete_and_fail(con):
+    # adding the batches again is a no-op
+    create_work_queue(con, "cube_3.samples_4", QUEUE)
+    assert _queue(con) == [(i, "pending", None, 0) for i in range(3)]
+
+    assert claim_batch(con, QUEUE, worker_id="a") == 0
+    assert claim_batch(con, QUEUE, worker_id="b") == 1
+    fail_batch(con, QUEUE, 1, worker_id="b", error="boom")
+    complete_batch(
+        con,
+        QUEUE,
+        0,
+        "a",
+        results=[_result(1), _result(2)],
+        solutions_table_name=SOLUTIONS,
+    )
+    assert _queue(con) == [
+        (0, "done", "a", 1),
+        (1, "failed", "b", 1),
+        (2, "pending", None, 0),
+    ]
+    assert con.sql(f"SELECT count(*) FROM {SOLUTIONS}").fetchone() == (2,)
+
+    # batches are claimed lowest first, so the failed batch is retried first
+    assert claim_batch(con, QUEUE, worker_id="c") == 1
+    assert claim_batch(con, QUEUE, worker_id="c") == 2
+    assert claim_batch(con, QUEUE, worker_id="c") is None
+
+    # a batch solved twice, after its lease expired, is only stored once
+    complete_batch(
+        con,
+        QUEUE,
+        0,
+        "c",
+        results=[_result(1), _result(2)],
+        solutions_table_name=SOLUTIONS,
+    )
+    assert con.sql(f"SELECT count(*) FROM {SOLUTIONS}").fetchone() == (2,)
+    assert report_progress(con, QUEUE)["done"] == 1
+
+
+def test_expired_leases_count_as_attempts(con):
+    claims = []
+    while (
+        batch_idx := claim_batch(con, QUEUE, "a", lease_seconds=0, max_attempts=2)
+    ) is not None:
+        claims.append(batch_idx)
+        # so that the lease has expired by the next claim
+        time.sleep(0.01)
+    assert claims == [0, 0, 1, 1, 2, 2]
+    assert _queue(con) == [(i, "failed", "a", 2) for i in range(3)]
+
+
+def test_run_queue_worker_solves_every_sample(tmp_path):
+    database = str(tmp_path / "blokk.duckdb")
+    stream_blokk_samples_to_duckdb(database=database, cube_size=3, max_blokk_volume=4)
+    run_queue_worker(database=database, cube_size=3, max_blokk_volume=4)
+    with duckdb.connect(database) as con:
+        # every sample of blokks up to volume 4 fills the 3x3x3 cube
+        assert con.sql(f"""
+            SELECT count(*), count(*) FILTER (status = 'solved') FROM {SOLUTIONS}
+        """).fetchone() == (42, 42)
+        assert {status for _, status, _, _ in _queue(con)} == {"done"}
+
+
+def test_worker_waits_for_the_lease_of_a_dead_worker(tmp_path):
+    database = str(tmp_path / "blokk.duckdb")
+    stream_blokk_samples_to_duckdb(database=database, cube_size=3, max_blokk_volume=4)
+    with duckdb.connect(database) as con:
+        create_work_queue(con, "cube_3.samples_4", QUEUE)
+        assert seconds_to_lease_expiry(con, QUEUE) is None
+        # a worker claims the only batch, and dies
+        assert claim_batch(con, QUEUE, worker_id="dead", lease_seconds=1) == 0
+        assert 0 < seconds_to_lease_expiry(con, QUEUE) <= 1.01
+
+    run_queue_worker(
+        database=database, cube_size=3, max_blokk_volume=4, worker_id="alive"
+    )
+    with duckdb.connect(database) as con:
+        assert _queue(con) == [(0, "done", "alive", 2)]
+        assert con.sql(f"SELECT count(*) FROM {SOLUTIONS}").fetchone() == (42,)